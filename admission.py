@@ -0,0 +1,125 @@
+import asyncio
+import re
+import time
+from _config import Config
+from shared import Shared
+from log import Log
+
+
+class Admission:
+    """ Server-wide egress bandwidth budget.
+        Keeps running totals (kbit/s) per camera, per client type and for the whole server,
+        so every join and leave costs O(1).
+    """
+    interval = 5  # Bitrate measurement period, secs
+
+    _bitrates = {}  # Last known bitrate of every stream, kbit/s: {(camera_hash, profile): kbit/s}
+    _counts = {}    # Clients of every stream by client type: {(camera_hash, profile): {'web': n, 'local': n}}
+    _web = {}       # Web sessions of every camera: {camera_hash: n}
+    _cameras = {}   # Egress of every camera: {camera_hash: kbit/s}
+    _types = {'web': 0, 'local': 0}
+    _total = 0
+
+    @staticmethod
+    def fits(camera_hash, profile, client_type):
+        """ Check if one more client of this stream is within all budgets
+        """
+        if client_type == 'web' and Config.web_limit and Admission._web.get(camera_hash, 0) >= Config.web_limit:
+            return False
+
+        bitrate = Admission._bitrates.get((camera_hash, profile), 0)
+        if not bitrate:
+            return True
+
+        limits = Config.bandwidth_limits if hasattr(Config, 'bandwidth_limits') else {}
+        cfg = Config.cameras[camera_hash]
+
+        for used, limit in (
+                (Admission._total, limits.get('total')),
+                (Admission._types[client_type], limits.get(client_type)),
+                (Admission._cameras.get(camera_hash, 0), cfg.get('bandwidth_limit'))):
+            if limit and used + bitrate > limit:
+                return False
+        return True
+
+    @staticmethod
+    def bitrate(camera_hash, profile):
+        """ Last known bitrate of the stream, kbit/s
+        """
+        return Admission._bitrates.get((camera_hash, profile), 0)
+
+    @staticmethod
+    def join(client, client_type):
+        """ Reserve bandwidth for the client, returns False if there is no room
+        """
+        key = (client.camera_hash, client.profile)
+        if key not in Admission._bitrates:
+            Admission._bitrates[key] = _get_sdp_bitrate(client.stream.camera.description)
+
+        if not Admission.fits(client.camera_hash, client.profile, client_type):
+            return False
+
+        Admission._add(key, client_type, 1)
+        client.client_type = client_type
+        return True
+
+    @staticmethod
+    def leave(client):
+        if not client.client_type:
+            return
+        Admission._add((client.camera_hash, client.profile), client.client_type, -1)
+        client.client_type = None
+
+    @staticmethod
+    async def run():
+        """ Infinite loop for streams bitrate measurement
+        """
+        while True:
+            await asyncio.sleep(Admission.interval)
+            for camera_hash, profiles in Shared.streams.items():
+                for profile, stream in profiles.items():
+                    if stream.camera:
+                        Admission._measure(camera_hash, profile, stream.camera)
+
+    @staticmethod
+    def _measure(camera_hash, profile, camera):
+        """ Update stream bitrate and move the totals by the difference.
+            The counter may be updated by an ingest thread meanwhile, a lost packet doesn't matter here
+        """
+        now = time.monotonic()
+        if camera.bytes_time:
+            key = (camera_hash, profile)
+            bitrate = camera.bytes * 8 / 1000 / (now - camera.bytes_time)
+            delta = bitrate - Admission._bitrates.get(key, 0)
+            Admission._bitrates[key] = bitrate
+
+            for client_type, count in Admission._counts.get(key, {}).items():
+                Admission._types[client_type] += delta * count
+                Admission._cameras[camera_hash] += delta * count
+                Admission._total += delta * count
+
+            Log.print(f'Admission: [{camera_hash}] [{profile}] {int(bitrate)} kbit/s, '
+                      f'total {int(Admission._total)} kbit/s')
+
+        camera.bytes, camera.bytes_time = 0, now
+
+    @staticmethod
+    def _add(key, client_type, count):
+        camera_hash = key[0]
+        bitrate = Admission._bitrates[key] * count
+
+        counts = Admission._counts.setdefault(key, {'web': 0, 'local': 0})
+        counts[client_type] += count
+        if client_type == 'web':
+            Admission._web[camera_hash] = Admission._web.get(camera_hash, 0) + count
+
+        Admission._types[client_type] += bitrate
+        Admission._cameras[camera_hash] = Admission._cameras.get(camera_hash, 0) + bitrate
+        Admission._total += bitrate
+
+
+def _get_sdp_bitrate(description):
+    """ Search "AS" (application specific) bandwidth in SDP details, kbit/s
+    """
+    res = re.match(r'AS:(\d+)', description['video'].get('bandwidth', '') if description['video'] else '')
+    return int(res.group(1)) if res else 0
@@ -0,0 +1,164 @@
+""" Implementations of the parsers before the single-pass rewrite, the reference for bench/parsers.py.
+    Results of the current ones must be identical.
+"""
+import re
+import time
+from random import randrange
+from _config import Config
+from log import Log
+
+
+def _parse_url(url):
+    """ Get URL components
+    """
+    rex = r'^((.+)://)?((.+?)(:(.+))?@)?(.+?)(:(\d+))?(/.*)?$'
+    parsed_url = re.match(rex, url)
+    if not parsed_url:
+        raise RuntimeError('Invalid rtsp url')
+    res = {
+        'scheme': parsed_url.group(2) or 'rtsp',
+        'login': parsed_url.group(4) or '',
+        'password': parsed_url.group(6) or '',
+        'host': parsed_url.group(7),
+        'tcp_port': int(parsed_url.group(9) or 554),
+        'path': parsed_url.group(10) or ''}
+    res['url'] = f'{res["scheme"]}://{res["host"]}:{res["tcp_port"]}{res["path"]}'
+    return res
+
+
+def _get_description(reply):
+    """ Search SDP (Session Description Protocol) in rtsp reply
+    """
+    blocks = reply.split('\r\n\r\n', 2)
+    if len(blocks) < 2:
+        raise RuntimeError('Invalid DESCRIBE reply')
+
+    sdp = blocks[1].strip()
+
+    details = {'video': {}, 'audio': {}}
+
+    res = re.match(r'.+?\nm=video (.+?)\r\n', sdp, re.DOTALL)
+    if res:
+        details['video'] = {'media': res.group(1), 'bandwidth': '', 'rtpmap': '', 'format': ''}
+
+        res = re.match(r'.+?\nm=video .+?\nb=([^\r\n]+)', sdp, re.DOTALL)
+        if res:
+            details['video']['bandwidth'] = res.group(1)
+
+        res = re.match(r'.+?\nm=video .+?\na=rtpmap:([^\r\n]+)/([^\r\n]+)', sdp, re.DOTALL)
+        if res:
+            details['video']['rtpmap'] = res.group(1) + '/' + res.group(2)
+            details['video']['clk_freq'] = int(res.group(2))
+
+        res = re.match(r'.+?\nm=video .+?\na=fmtp:([^\r\n]+)', sdp, re.DOTALL)
+        if res:
+            details['video']['format'] = res.group(1)
+
+    res = re.match(r'.+?\nm=audio (.+?)\r\n', sdp, re.DOTALL)
+    if res:
+        details['audio'] = {'media': res.group(1), 'rtpmap': ''}
+
+        res = re.match(r'.+?\nm=audio .+?\na=rtpmap:([^\r\n]+)/([^\r\n]+)', sdp, re.DOTALL)
+        if res:
+            details['audio']['rtpmap'] = res.group(1) + '/' + res.group(2)
+            details['audio']['clk_freq'] = int(res.group(2))
+
+    return details
+
+
+def _get_track_ids(reply):
+    """ Search track ID in rtsp reply
+    """
+    track_ids = re.findall(r'\na=control:.*?((?:track|stream).*?\d)', reply)
+    if not track_ids:
+        raise RuntimeError('Invalid track ID in reply')
+    return track_ids
+
+
+def _get_rtp_info(reply):
+    """ Search "RTP-Info" string in rtsp reply
+    """
+    if not reply:
+        return
+    res = re.match(r'.+?\r\n(RTP-Info: .+?)\r\n', reply, re.DOTALL)
+    if not res:
+        raise RuntimeError('Invalid RTP-Info')
+    rtp_info = res.group(1)
+
+    seq = re.findall(r';seq=(\d+)', rtp_info)
+    rtptime = re.findall(r';rtptime=(\d+)', rtp_info)
+    if not seq or not rtptime:
+        raise RuntimeError('Invalid RTP-Info')
+
+    return {'seq': seq, 'rtptime': rtptime, 'starttime': time.time()}
+
+
+def _get_cseq(ask):
+    """ Search CSeq in rtsp ask
+    """
+    res = re.match(r'.+?\r\nCSeq: (\d+)', ask, re.DOTALL)
+    if not res:
+        raise RuntimeError('invalid incoming CSeq')
+    return int(res.group(1))
+
+
+def _get_user_agent(ask):
+    """ Search User-Agent in rtsp ask
+        [ -~] means any ASCII character from the space to the tilde
+    """
+    res = re.match(r'.+?\r\nUser-Agent: ([ -~]+)\r\n', ask, re.DOTALL + re.IGNORECASE)
+    if not res:
+        return 'unknown user agent'
+    return res.group(1)
+
+
+def _get_ports(ask):
+    """ Search port numbers in rtsp ask
+    """
+    res = re.match(r'.+?\nTransport:[^\n]+client_port=(\d+)-(\d+)', ask, re.DOTALL)
+    if not res:
+        raise RuntimeError('invalid transport ports')
+    return [int(res.group(1)), int(res.group(2))]
+
+
+def client_get_description(self):
+    """ Create new SDP based on original one from the camera
+    """
+    sdp = self.stream.camera.description
+    res = 'v=0\r\n' \
+        f'o=- {randrange(100000, 999999)} {randrange(1, 10)} IN IP4 {Config.local_ip}\r\n' \
+        's=python-rtsp-server\r\n' \
+        't=0 0'
+    # 'a=range:npt=0-'
+
+    if not sdp['video']:
+        return res
+    res += f'\r\nm=video {sdp["video"]["media"]}\r\n' \
+        'c=IN IP4 0.0.0.0\r\n' \
+        f'b={sdp["video"]["bandwidth"]}\r\n' \
+        f'a=rtpmap:{sdp["video"]["rtpmap"]}\r\n' \
+        f'a=fmtp:{sdp["video"]["format"]}\r\n' \
+        'a=control:track1'
+
+    if not sdp['audio']:
+        return res
+    res += f'\r\nm=audio {sdp["audio"]["media"]}\r\n' \
+        f'a=rtpmap:{sdp["audio"]["rtpmap"]}\r\n' \
+        'a=control:track2'
+    return res
+
+
+async def client_response(self, *lines, status='200 OK'):
+    """ Reply to client with given params
+    """
+    reply = f'RTSP/1.0 {status}\r\n' \
+        f'CSeq: {self.cseq}\r\n'
+
+    for row in lines:
+        reply += f'{row}\r\n'
+
+    reply += '\r\n'
+
+    self.writer.write(reply.encode())
+
+    Log.print(f'~~~ Client: write\n{reply}')
@@ -0,0 +1,164 @@
+""" Time per call of the RTSP/SDP parsers against their legacy implementations (bench/legacy.py),
+    on the replies of real cameras and the asks of real clients (bench/corpus.py).
+    Usage (from the project folder, _config.py is required):
+        python3 bench/parsers.py [calls]
+    Exits with status 1 if any result differs from the legacy one or any parser is slower than its threshold.
+"""
+import gc
+import os
+import random
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import camera  # noqa: E402
+import client  # noqa: E402
+import corpus  # noqa: E402
+import legacy  # noqa: E402
+from _config import Config  # noqa: E402
+
+# Regression thresholds: the highest allowed ratio of the current time per call to the legacy one
+THRESHOLDS = {
+    'camera._parse_url': 0.85,
+    'camera._get_description': 0.5,
+    'camera._get_track_ids': 0.95,
+    'camera._get_rtp_info': 0.85,
+    'client._get_cseq': 0.6,
+    'client._get_user_agent': 0.7,
+    'client._get_ports': 0.8,
+    'Client._get_description': 0.9,
+    'Client._response': 0.95,
+}
+
+# Messages every parser must fail on (or not) the same way as the legacy one
+MALFORMED = ('', 'RTSP/1.0 200 OK\r\n\r\n', 'RTSP/1.0 200 OK\r\nCSeq: x\r\n\r\n', '\r\nCSeq: 1\r\n\r\nv=0')
+
+
+class _Writer:
+    def __init__(self):
+        self.data = b''
+
+    def write(self, data):
+        self.data = data
+
+
+def _client():
+    c = client.Client.__new__(client.Client)
+    c.stream = SimpleNamespace(camera=None)
+    c.cseq = 5
+    c.writer = _Writer()
+    return c
+
+
+def _await(coro):
+    """ Run a coroutine without awaits inside, the event loop would be the most of its time
+    """
+    try:
+        coro.send(None)
+    except StopIteration:
+        pass
+
+
+def _camera(description):
+    return SimpleNamespace(description=description, sdp=None)
+
+
+def _describe(method):
+    c = _client()
+
+    def run(camera):
+        c.stream.camera = camera
+        return method(c)
+    return run
+
+
+def _respond(method):
+    c = _client()
+
+    def run(lines):
+        _await(method(c, *lines))
+        return c.writer.data
+    return run
+
+
+def _cases():
+    """ (name, legacy, current, inputs for timing, inputs for comparison only)
+    """
+    # Cameras keep their description, as hundreds of clients reconnect to the same ones
+    cameras = tuple(_camera(camera._get_description(reply)) for reply in corpus.DESCRIBE_REPLIES.values())
+    describes = tuple(corpus.DESCRIBE_REPLIES.values())
+    plays = tuple(corpus.PLAY_REPLIES.values())
+    return (
+        ('camera._parse_url', legacy._parse_url, camera._parse_url, corpus.URLS,
+         MALFORMED + ('rtsp://', '://host', 'rtsp://@host', 'rtsp://user@', 'rtsp://a@b@c/d', 'host:port/path',
+                      'rtsp://u:@h', 'rtsp://h:5a4/p', 'rtsp://h/p:554', 'rtsp://:554')),
+        ('camera._get_description', legacy._get_description, camera._get_description, describes, MALFORMED),
+        ('camera._get_track_ids', legacy._get_track_ids, camera._get_track_ids, describes, MALFORMED),
+        ('camera._get_rtp_info', legacy._get_rtp_info, camera._get_rtp_info, plays, MALFORMED + describes),
+        ('client._get_cseq', legacy._get_cseq, client._get_cseq, corpus.CLIENT_ASKS, MALFORMED),
+        ('client._get_user_agent', legacy._get_user_agent, client._get_user_agent, corpus.CLIENT_ASKS, MALFORMED),
+        ('client._get_ports', legacy._get_ports, client._get_ports, corpus.SETUP_ASKS, MALFORMED + corpus.CLIENT_ASKS),
+        ('Client._get_description', _describe(legacy.client_get_description),
+         _describe(client.Client._get_description), cameras, (_camera({'video': {}, 'audio': {}}),)),
+        ('Client._response', _respond(legacy.client_response), _respond(client.Client._response), corpus.RESPONSES, ()),
+    )
+
+
+def _result(func, arg):
+    random.seed(0)
+    try:
+        res = func(arg)
+    except Exception as e:
+        return f'{type(e).__name__}: {e}'
+    if isinstance(res, dict):
+        res.pop('starttime', None)  # _get_rtp_info
+    return res
+
+
+def _time(funcs, inputs, calls):
+    """ The best of 35 short interleaved runs of every function, microseconds per call.
+        Short runs without garbage collection are less likely to be hit by other processes
+    """
+    rounds = max(1, calls // len(inputs) // 5)
+    best = [None] * len(funcs)
+    gc.disable()
+    for _ in range(35):
+        for idx, func in enumerate(funcs):
+            start = time.perf_counter()
+            for _ in range(rounds):
+                for arg in inputs:
+                    func(arg)
+            elapsed = time.perf_counter() - start
+            best[idx] = elapsed if best[idx] is None else min(best[idx], elapsed)
+    gc.enable()
+    return [elapsed / (rounds * len(inputs)) * 1e6 for elapsed in best]
+
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    failed = False
+
+    # Both implementations log the same way, time the parsing only
+    Config.debug = False
+
+    print(f'{"parser":<26}{"legacy us":>10}{"current us":>12}{"ratio":>8}{"limit":>8}')
+    for name, old, new, inputs, extra in _cases():
+        for arg in inputs + extra:
+            if _result(old, arg) != _result(new, arg):
+                print(f'{name}: different result for {arg!r}:\n  legacy  {_result(old, arg)!r}\n'
+                      f'  current {_result(new, arg)!r}')
+                failed = True
+
+        old_time, new_time = _time((old, new), inputs, calls)
+        ratio = new_time / old_time
+        status = '' if ratio <= THRESHOLDS[name] else '  SLOWER THAN THRESHOLD'
+        failed = failed or bool(status)
+        print(f'{name:<26}{old_time:>10.2f}{new_time:>12.2f}{ratio:>8.2f}{THRESHOLDS[name]:>8.2f}{status}')
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+""" Socket send calls per Mbit for interleaved TCP clients, with and without writes coalescing.
+    Usage (from the project folder, _config.py is required):
+        python3 bench/tcp_writes.py [clients] [chunks per tick]
+"""
+import asyncio
+import os
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from client import Client  # noqa: E402
+
+TICKS = 2000
+CHUNK = b'$\x00\x07\xfc' + b'\x00' * 2044  # _interleave reads the camera by 2048 bytes
+
+_sends = 0
+
+
+def _count(method):
+    def wrapper(self, *args, **kwargs):
+        global _sends
+        _sends += 1
+        return method(self, *args, **kwargs)
+    return wrapper
+
+
+async def _run(clients, chunks, coalesce_bytes):
+    """ Feed the clients like Camera._interleave does: several chunks per event loop tick
+    """
+    global _sends
+    Client.coalesce_bytes = coalesce_bytes
+    accepted = []
+
+    async def on_connect(reader, writer):
+        accepted.append(Client(reader, writer))
+
+    server = await asyncio.start_server(on_connect, '127.0.0.1', 0)
+    port = server.sockets[0].getsockname()[1]
+
+    async def drain(reader):
+        while await reader.read(1 << 20):
+            pass
+
+    readers = []
+    for _ in range(clients):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        readers.append((asyncio.create_task(drain(reader)), writer))
+    while len(accepted) < clients:
+        await asyncio.sleep(0.01)
+
+    _sends = 0
+    start = time.perf_counter()
+    for _ in range(TICKS):
+        for _ in range(chunks):
+            for client in accepted:
+                client.write(CHUNK)
+        await asyncio.sleep(0)
+    for client in accepted:
+        client.flush()
+    elapsed = time.perf_counter() - start
+
+    mbits = TICKS * chunks * len(CHUNK) * clients * 8 / 1e6
+    print(f'coalesce_bytes={coalesce_bytes:<6} sends {_sends:<7} sends/Mbit {_sends / mbits:<7.2f} '
+          f'{mbits / elapsed:.0f} Mbit/s')
+
+    for client in accepted:
+        client.writer.close()
+    for task, writer in readers:
+        writer.close()
+        await task
+    server.close()
+
+
+async def main():
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    chunks = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    print(f'{clients} clients, {chunks} chunks of {len(CHUNK)} bytes per tick')
+
+    socket.socket.send = _count(socket.socket.send)
+    socket.socket.sendmsg = _count(socket.socket.sendmsg)
+
+    await _run(clients, chunks, 0)
+    await _run(clients, chunks, 65536)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
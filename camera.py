@@ -1,35 +1,96 @@
 import asyncio
 import re
+import socket
+import threading
 import time
 from hashlib import md5
 from _config import Config
 from shared import Shared
 from log import Log
+from tracer import Tracer
+from jitter import JitterBuffer
+from pool import Pool
+from ingest import Ingest
+
+# Precompiled patterns of the camera replies parsers
+_URL = re.compile(r'^((.+)://)?((.+?)(:(.+))?@)?(.+?)(:(\d+))?(/.*)?$')
+_TRACK_ID = re.compile(r'\na=control:.*?((?:track|stream).*?\d)')
+_RTP_INFO = re.compile(r'\r\n(RTP-Info: .+?)\r\n', re.DOTALL)
+_RTP_INFO_PARAM = re.compile(r';(seq|rtptime)=(\d+)')
+_CONTENT_LENGTH = re.compile(rb'\r\nContent-Length: *(\d+)', re.IGNORECASE)
+_SOURCE = re.compile(r'\nTransport:[^\n]*?;source=([^;\r\n]+)')
 
 
 class Camera:
-    def __init__(self, camera_hash):
+    __slots__ = (
+        'hash', 'profile', 'stream', 'url', 'tcp_task', 'udp_ports', 'server_ports', 'track_ids', 'udp_transports',
+        'server_transports', 'description', 'sdp', 'session_id', 'rtp_info', 'realm', 'nonce', 'cseq', 'reader',
+        'writer', 'tail', 'source', 'bytes', 'bytes_time', 'loop')
+
+    def __init__(self, camera_hash, profile='main'):
         self.hash = camera_hash
-        self.url = _parse_url(Config.cameras[camera_hash]['url'])
+        self.profile = profile
+        self.stream = Shared.streams[camera_hash][profile]
+        self.url = _parse_url(get_profiles(camera_hash)[profile])
         self.tcp_task = False
         self.udp_ports, self.track_ids = [], []
+        self.server_ports = []  # Advertised to clients, the stream never comes from them
+        self.udp_transports, self.server_transports = {}, []
         self.description = {}
+        self.sdp = None  # Media part of the clients' SDP, see Client._get_description
         self.session_id, self.rtp_info, self.realm, self.nonce = None, None, None, None
         self.cseq = 1
         self.reader = None
         self.writer = None
+        self.tail = b''  # Interleaved data read along with the last reply
+        self.source = None  # RTP source address from the SETUP reply, the RTSP peer if not given
+        self.bytes, self.bytes_time = 0, None  # Ingest counter for bitrate measurement
+        self.loop = Ingest.assign(self)  # The camera's event loop, None for the main one
 
     async def connect(self):
         """ Open TCP socket and connect to the camera
         """
-        self.udp_ports = self._get_self_udp_ports()
+        try:
+            await Ingest.run(self.loop, self._connect())
+        except Exception:
+            Ingest.release(self)
+            raise
+
+    async def play(self):
+        """ Start playing and proxy the stream to all connected clients
+        """
+        await Ingest.run(self.loop, self._play())
 
+    async def close(self):
+        """ Close all opened sockets and transports
+        """
+        try:
+            await Ingest.run(self.loop, self._close())
+        finally:
+            Ingest.release(self)
+
+    async def _connect(self):
         try:
             self.reader, self.writer = await asyncio.open_connection(self.url['host'], self.url['tcp_port'])
         except Exception as e:
-            Log.print(f"Camera: error: can't connect [{self.hash}]: {e}")
-            return
+            Log.print(f"Camera: error: can't connect [{self.hash}] [{self.profile}]: {e}")
+            raise
 
+        try:
+            await self._setup()
+        except Exception:
+            # The camera isn't stored yet, so nobody else would close it
+            self.writer.close()
+            for ports in self.udp_ports + self.server_ports:
+                UdpPorts.release(ports)
+            self.udp_ports, self.server_ports = [], []
+            raise
+
+        Log.write(f'Camera: connected [{self.hash}] [{self.profile}]')
+
+    async def _setup(self):
+        """ OPTIONS, DESCRIBE and SETUP of the tracks
+        """
         await self._request('OPTIONS', self.url['url'])
 
         reply, code = await self._request(
@@ -46,30 +107,34 @@ class Camera:
                 'Accept: application/sdp')
 
         self.description = _get_description(reply)
+        self.sdp = None
 
         self.track_ids = _get_track_ids(reply)
 
+        if not Config.tcp_mode:
+            self.udp_ports = [UdpPorts.allocate() for _ in self.track_ids[:2]]
+            self.server_ports = [UdpPorts.allocate() for _ in self.track_ids[:2]]
+
         reply, code = await self._request(
             'SETUP',
             f'{self.url["url"]}/{self.track_ids[0]}',
             self._get_transport_line(0))
 
         self.session_id = _get_session_id(reply)
+        self.source = _get_source(reply)
 
         if len(self.track_ids) > 1:
-            await self._request(
+            reply, code = await self._request(
                 'SETUP',
                 f'{self.url["url"]}/{self.track_ids[1]}',
                 self._get_transport_line(1),
                 f'Session: {self.session_id}')
 
-        self.rtp_info = None
+            self.source = self.source or _get_source(reply)
 
-        Log.write(f'Camera: connected [{self.hash}]')
+        self.rtp_info = None
 
-    async def play(self):
-        """ Start playing and proxy the stream to all connected clients
-        """
+    async def _play(self):
         cmd = (
             'PLAY',
             self.url['url'],
@@ -85,7 +150,20 @@ class Camera:
                 reply, code = await self._request(*cmd)
                 self.rtp_info = _get_rtp_info(reply)
 
-                self.tcp_task = asyncio.create_task(self._interleave())
+                if _zero_copy():
+                    # From now on the socket is read into the pool's buffers. The data read already is fed
+                    # after the clients' PLAY replies, but before the socket is read again
+                    protocol = CameraTcpProtocol(self)
+                    buffered = self.reader._buffer  # StreamReader has no public way to take its buffer
+                    data = self.tail + buffered
+                    buffered.clear()
+                    self.writer.transport.set_protocol(protocol)
+                    self.writer.transport.resume_reading()  # The reader might pause it with the buffer full
+                    asyncio.get_running_loop().call_soon(protocol.feed, data)
+                    self.tcp_task = True
+                else:
+                    self.tcp_task = asyncio.create_task(self._interleave(self.tail))
+                self.tail = b''
         else:
             reply, code = await self._request(*cmd)
 
@@ -98,28 +176,42 @@ class Camera:
             if self.description['audio']:
                 await self._start_udp_server(1)
 
-    async def close(self):
-        """ Close all opened sockets and transports
-        """
+    async def _close(self):
         self.writer.close()
 
         if not Config.tcp_mode:
-            for _idx, transport in self.udp_transports.items():
+            for idx, transport in self.udp_transports.items():
+                transport.close()
+                jitter = transport.get_protocol().jitter
+                if jitter:
+                    jitter.close()
+                    Log.write(f'Camera: jitter buffer [{self.hash}] [{self.profile}] track {idx}: {jitter.stats()}')
+            for transport in self.server_transports:
                 transport.close()
+            for ports in self.udp_ports + self.server_ports:
+                UdpPorts.release(ports)
+            self.udp_ports, self.server_ports = [], []
 
-        Log.write(f'Camera: closed [{self.hash}]')
+        Log.write(f'Camera: closed [{self.hash}] [{self.profile}]')
 
-    async def _interleave(self):
+    async def _interleave(self, tail=b''):
+        """ Forward the interleaved data, starting with the given data read along with the PLAY reply
+        """
+        track = self.stream.tracks[0]
+        trace = Tracer.get(self.hash, self.profile)
         while True:
-            frame = await self.reader.read(2048)
-
-            clients = Shared.data[self.hash]['clients']
+            frame, tail = tail or await self.reader.read(2048), b''
+            self.bytes += len(frame)
 
-            if not clients:
+            if not track.subscribers:
                 return
 
-            for session_id in list(clients):
-                await clients[session_id].write(frame)
+            if trace:
+                trace.write(frame, track.subscribers)
+                continue
+
+            for client in track.subscribers:
+                client.write(frame)
 
     async def _request(self, option, url, *lines):
         """ Ask the camera option with given lines.
@@ -131,8 +223,17 @@ class Camera:
 
         if data[0:1] == b'$':
             Log.print('Camera: read: interleaved binary data')
+            self.tail = data
             return None, 200
 
+        # The camera may start streaming right after the PLAY reply
+        end = data.find(b'\r\n\r\n') + 4
+        if end > 3:
+            length = _CONTENT_LENGTH.search(data, 0, end)
+            if length:
+                end += int(length.group(1))
+            data, self.tail = data[:end], data[end:]
+
         reply = data.decode()
 
         Log.print(f'~~~ Camera: read:\n{reply}')
@@ -185,75 +286,296 @@ class Camera:
         return 'Transport: RTP/AVP;unicast;' \
             f'client_port={self.udp_ports[idx][0]}-{self.udp_ports[idx][1]}'
 
-    def _get_self_udp_ports(self):
-        """ Calculate port number from free user ports range
-        """
-        start_port = Config.start_udp_port
-        idx = list(Config.cameras.keys()).index(self.hash) * 4
-        return [
-            [start_port + idx, start_port + idx + 1],
-            [start_port + idx + 2, start_port + idx + 3]]
-
     async def _start_udp_server(self, idx):
         """ Create datagram endpoint
         """
-        if not hasattr(self, 'udp_transports'):
-            self.udp_transports = {}
-
         if idx in self.udp_transports:
             return
 
         try:
             loop = asyncio.get_running_loop()
 
-            transport, _protocol = await loop.create_datagram_endpoint(
-                lambda: CameraUdpProtocol(self.hash, idx),
-                local_addr=('0.0.0.0', self.udp_ports[idx][0]))
+            if _zero_copy():
+                self.udp_transports[idx] = CameraUdpReader(self, idx, ('0.0.0.0', self.udp_ports[idx][0]))
+            else:
+                transport, _protocol = await loop.create_datagram_endpoint(
+                    lambda: CameraUdpProtocol(self, idx),
+                    local_addr=('0.0.0.0', self.udp_ports[idx][0]))
 
-            self.udp_transports[idx] = transport
+                self.udp_transports[idx] = transport
+
+            for port in self.server_ports[idx]:
+                transport, _protocol = await loop.create_datagram_endpoint(
+                    lambda: ServerPortProtocol(self.stream, idx),
+                    local_addr=('0.0.0.0', port))
+
+                self.server_transports.append(transport)
 
         except Exception as e:
             Log.print(f"Camera: error: can't create_datagram_endpoint: {e}")
 
 
+class UdpPorts:
+    """ Pool of (RTP, RTCP) port pairs starting from "start_udp_port", freed pairs are reused first.
+        Cameras on the ingest threads share it
+    """
+    _free = []
+    _next = 0
+    _lock = threading.Lock()
+
+    @staticmethod
+    def allocate():
+        with UdpPorts._lock:
+            if UdpPorts._free:
+                return UdpPorts._free.pop()
+
+            port = max(UdpPorts._next, Config.start_udp_port)
+            UdpPorts._next = port + 2
+            return [port, port + 1]
+
+    @staticmethod
+    def release(ports):
+        with UdpPorts._lock:
+            UdpPorts._free.append(ports)
+
+
 class CameraUdpProtocol(asyncio.DatagramProtocol):
     """ This callback will be called when connection to the camera is made
     """
-    def __init__(self, camera_hash, idx):
-        self.hash = camera_hash
-        self.idx = idx
-        self.transport = None
+    __slots__ = ('camera', 'host', 'track', 'trace', 'jitter', 'sendto', 'dropped')
+
+    def __init__(self, camera, idx):
+        self.camera = camera
+        self.host = camera.source or camera.writer.get_extra_info('peername')[0]
+        self.dropped = False
+        self.track = camera.stream.tracks[idx]
+        self.trace = Tracer.get(camera.hash, camera.profile)
+        self.jitter = None
+        self.sendto = None
+
+        cfg = Config.cameras[camera.hash]
+        if 'jitter_buffer_ms' in cfg:
+            window = cfg['jitter_buffer_ms']
+        else:
+            window = Config.jitter_buffer_ms if hasattr(Config, 'jitter_buffer_ms') else 0
+        if window:
+            size = Config.jitter_buffer_packets if hasattr(Config, 'jitter_buffer_packets') else 64
+            self.jitter = JitterBuffer(self.forward, window / 1000, size)
 
     def connection_made(self, transport):
-        self.transport = transport
+        self.sendto = transport.sendto
 
     def datagram_received(self, data, addr):
-        # This situation is impossible, just safety catch
-        if not Shared.data[self.hash]['camera']:
+        if addr[0] != self.host:
+            if not self.dropped:
+                self.dropped = True
+                Log.write(f'Camera: warning: datagram from {addr[0]} dropped, the stream source is {self.host} '
+                          f'[{self.camera.hash}]')
+            return  # Only the camera streams to this port
+        self.camera.bytes += len(data)
+
+        if self.jitter:
+            # The receive time is taken now, the packet may wait in the buffer
+            self.jitter.push(data, self.trace.receive() if self.trace else None)
+        else:
+            self.forward(data)
+
+    def forward(self, data, received=None):
+        if self.trace:
+            self.trace.sendto(data, self.track.subscribers, self.sendto, received)
             return
 
-        for _sid, client in Shared.data[self.hash]['clients'].items():
-            self.transport.sendto(data, (client.host, client.udp_ports[self.idx][0]))
+        for client_addr in self.track.subscribers:
+            self.sendto(data, client_addr)
+
+
+class CameraUdpReader(CameraUdpProtocol):
+    """ Zero-copy version of CameraUdpProtocol: datagrams are received straight into the pool's buffers
+        and forwarded as memoryview slices. Plays the datagram transport's part too.
+    """
+    __slots__ = ('sock', 'slab', 'offset')
+
+    max_datagram = 9000  # Jumbo frame
+
+    def __init__(self, camera, idx, local_addr):
+        super().__init__(camera, idx)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setblocking(False)
+        self.sock.bind(local_addr)
+        self.slab, self.offset = Pool.get(), 0
+        self.sendto = self._sendto
+        asyncio.get_running_loop().add_reader(self.sock.fileno(), self._read)
+
+    def get_protocol(self):
+        return self
+
+    def close(self):
+        asyncio.get_running_loop().remove_reader(self.sock.fileno())
+        self.sock.close()
+        Pool.release(self.slab)
+
+    def _read(self):
+        """ The socket is readable: receive a batch of datagrams
+        """
+        for _ in range(64):
+            if len(self.slab.view) - self.offset < CameraUdpReader.max_datagram:
+                Pool.release(self.slab)
+                self.slab, self.offset = Pool.get(), 0
+            try:
+                nbytes, _ancdata, flags, addr = self.sock.recvmsg_into([self.slab.view[self.offset:]])
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                Log.print(f"Camera: error: can't receive datagram [{self.camera.hash}]: {e}")
+                return
+
+            data = self.slab.view[self.offset:self.offset + nbytes]
+            self.offset += nbytes
+            if flags & socket.MSG_TRUNC:
+                Log.print(f'Camera: warning: datagram is too long, skipped [{self.camera.hash}]')
+                continue
+            self.datagram_received(data, addr)
+
+    def _sendto(self, data, addr):
+        try:
+            self.sock.sendto(data, addr)
+        except (BlockingIOError, InterruptedError):
+            pass  # The socket buffer is full, drop the datagram like a congested network does
+        except OSError as e:
+            Log.print(f"Camera: error: can't send datagram to {addr}: {e}")
+
+
+class CameraTcpProtocol(asyncio.BufferedProtocol):
+    """ Zero-copy version of Camera._interleave: the camera's socket is read straight into the pool's buffers
+        and forwarded as memoryview slices
+    """
+    __slots__ = ('camera', 'track', 'trace', 'slab', 'offset')
+
+    min_read = 2048
+
+    def __init__(self, camera):
+        self.camera = camera
+        self.track = camera.stream.tracks[0]
+        self.trace = Tracer.get(camera.hash, camera.profile)
+        self.slab, self.offset = Pool.get(), 0
+
+    def get_buffer(self, sizehint):
+        if len(self.slab.view) - self.offset < CameraTcpProtocol.min_read:
+            Pool.release(self.slab)
+            self.slab, self.offset = Pool.get(), 0
+        return self.slab.view[self.offset:]
+
+    def buffer_updated(self, nbytes):
+        frame = self.slab.view[self.offset:self.offset + nbytes]
+        self.offset += nbytes
+        self.camera.bytes += nbytes
+
+        if self.trace:
+            self.trace.write(frame, self.track.subscribers, self.slab)
+            return
+
+        for client in self.track.subscribers:
+            client.write(frame, self.slab)
+
+    def feed(self, data):
+        """ Forward the data read from the socket before the protocol took it over
+        """
+        view = memoryview(data)
+        while view:
+            buffer = self.get_buffer(len(view))
+            nbytes = min(len(buffer), len(view))
+            buffer[:nbytes] = view[:nbytes]
+            self.buffer_updated(nbytes)
+            view = view[nbytes:]
+
+    def connection_lost(self, exc):
+        Pool.release(self.slab)
+
+
+class ServerPortProtocol(asyncio.DatagramProtocol):
+    """ Server ports of the track advertised to clients: their RTCP receiver reports (and NAT punching packets)
+        keep their sessions alive, nothing is forwarded
+    """
+    def __init__(self, stream, idx):
+        self.stream = stream
+        self.idx = idx
+
+    def datagram_received(self, data, addr):
+        # A copy: the main loop can change the clients while an ingest thread reads them
+        for client in tuple(self.stream.clients):
+            if client.host == addr[0] and addr[1] in client.udp_ports.get(self.idx, ()):
+                client.touch()
+
+
+def get_profiles(camera_hash):
+    """ Main stream and substreams of the camera, by profile name
+    """
+    cfg = Config.cameras[camera_hash]
+    profiles = {'main': cfg['url']}
+    if 'profiles' in cfg and cfg['profiles']:
+        profiles.update(cfg['profiles'])
+    return profiles
+
+
+def _zero_copy():
+    return Config.zero_copy if hasattr(Config, 'zero_copy') else False
 
 
 def _parse_url(url):
     """ Get URL components
     """
-    rex = r'^((.+)://)?((.+?)(:(.+))?@)?(.+?)(:(\d+))?(/.*)?$'
-    parsed_url = re.match(rex, url)
-    if not parsed_url:
-        raise RuntimeError('Invalid rtsp url')
+    parts = _split_url(url) or _match_url(url)
     res = {
-        'scheme': parsed_url.group(2) or 'rtsp',
-        'login': parsed_url.group(4) or '',
-        'password': parsed_url.group(6) or '',
-        'host': parsed_url.group(7),
-        'tcp_port': int(parsed_url.group(9) or 554),
-        'path': parsed_url.group(10) or ''}
+        'scheme': parts[0] or 'rtsp',
+        'login': parts[1],
+        'password': parts[2],
+        'host': parts[3],
+        'tcp_port': int(parts[4] or 554),
+        'path': parts[5]}
     res['url'] = f'{res["scheme"]}://{res["host"]}:{res["tcp_port"]}{res["path"]}'
     return res
 
 
+def _split_url(url):
+    """ [<scheme>://][<login>[:<password>]@]<host>[:<port>][/<path>] without regex.
+        Returns None for unusual URLs (several "://" or "@"), they are left to _match_url
+    """
+    scheme, sep, rest = url.partition('://')
+    if not sep:
+        scheme, rest = '', url
+    elif not scheme:
+        return
+    if not rest or '://' in rest or rest.count('@') > 1 or '\n' in url:
+        return
+
+    login, at, host = rest.rpartition('@')
+    if at and (not login or not host):
+        return
+    password = ''
+    colon = login.find(':', 1)
+    if 0 < colon < len(login) - 1:
+        login, password = login[:colon], login[colon + 1:]
+
+    end = host.find('/', 1)
+    if end < 0:
+        end = len(host)
+    port = ''
+    colon = host.rfind(':', 1, end)
+    if colon > 0 and host[colon + 1:end].isdecimal():
+        port = host[colon + 1:end]
+    else:
+        colon = end
+    return scheme, login, password, host[:colon], port, host[end:]
+
+
+def _match_url(url):
+    parsed_url = _URL.match(url)
+    if not parsed_url:
+        raise RuntimeError('Invalid rtsp url')
+    return (parsed_url.group(2), parsed_url.group(4) or '', parsed_url.group(6) or '', parsed_url.group(7),
+            parsed_url.group(9), parsed_url.group(10) or '')
+
+
 def _get_auth_params(reply):
     """ Search digest auth realm and nonce in reply
     """
@@ -265,49 +587,49 @@ def _get_auth_params(reply):
 
 
 def _get_description(reply):
-    """ Search SDP (Session Description Protocol) in rtsp reply
+    """ Search SDP (Session Description Protocol) in rtsp reply.
+        One pass over the lines: every attribute is the first one after its "m=" line
     """
     blocks = reply.split('\r\n\r\n', 2)
     if len(blocks) < 2:
         raise RuntimeError('Invalid DESCRIBE reply')
 
-    sdp = blocks[1].strip()
-
     details = {'video': {}, 'audio': {}}
+    video, audio = None, None
+
+    for line in blocks[1].strip().split('\r\n')[1:]:
+        if video is not None:
+            if not video['bandwidth'] and line.startswith('b='):
+                video['bandwidth'] = line[2:]
+            elif not video['rtpmap'] and line.startswith('a=rtpmap:'):
+                _set_rtpmap(video, line)
+            elif not video['format'] and line.startswith('a=fmtp:'):
+                video['format'] = line[7:]
+        elif line.startswith('m=video ') and len(line) > 8:
+            video = details['video'] = {'media': line[8:], 'bandwidth': '', 'rtpmap': '', 'format': ''}
+
+        if audio is not None:
+            if not audio['rtpmap'] and line.startswith('a=rtpmap:'):
+                _set_rtpmap(audio, line)
+        elif line.startswith('m=audio ') and len(line) > 8:
+            audio = details['audio'] = {'media': line[8:], 'rtpmap': ''}
 
-    res = re.match(r'.+?\nm=video (.+?)\r\n', sdp, re.DOTALL)
-    if res:
-        details['video'] = {'media': res.group(1), 'bandwidth': '', 'rtpmap': '', 'format': ''}
-
-        res = re.match(r'.+?\nm=video .+?\nb=([^\r\n]+)', sdp, re.DOTALL)
-        if res:
-            details['video']['bandwidth'] = res.group(1)
-
-        res = re.match(r'.+?\nm=video .+?\na=rtpmap:([^\r\n]+)/([^\r\n]+)', sdp, re.DOTALL)
-        if res:
-            details['video']['rtpmap'] = res.group(1) + '/' + res.group(2)
-            details['video']['clk_freq'] = int(res.group(2))
-
-        res = re.match(r'.+?\nm=video .+?\na=fmtp:([^\r\n]+)', sdp, re.DOTALL)
-        if res:
-            details['video']['format'] = res.group(1)
-
-    res = re.match(r'.+?\nm=audio (.+?)\r\n', sdp, re.DOTALL)
-    if res:
-        details['audio'] = {'media': res.group(1), 'rtpmap': ''}
+    return details
 
-        res = re.match(r'.+?\nm=audio .+?\na=rtpmap:([^\r\n]+)/([^\r\n]+)', sdp, re.DOTALL)
-        if res:
-            details['audio']['rtpmap'] = res.group(1) + '/' + res.group(2)
-            details['audio']['clk_freq'] = int(res.group(2))
 
-    return details
+def _set_rtpmap(media, line):
+    """ "a=rtpmap:96 H264/90000": clock frequency is the part after the last slash
+    """
+    rtpmap, _slash, clk_freq = line[9:].rpartition('/')
+    if rtpmap and clk_freq:
+        media['rtpmap'] = f'{rtpmap}/{clk_freq}'
+        media['clk_freq'] = int(clk_freq)
 
 
 def _get_track_ids(reply):
     """ Search track ID in rtsp reply
     """
-    track_ids = re.findall(r'\na=control:.*?((?:track|stream).*?\d)', reply)
+    track_ids = _TRACK_ID.findall(reply)
     if not track_ids:
         raise RuntimeError('Invalid track ID in reply')
     return track_ids
@@ -322,18 +644,25 @@ def _get_session_id(reply):
     return res.group(1)
 
 
+def _get_source(reply):
+    """ Search "source" parameter of the "Transport" string in rtsp reply
+    """
+    res = _SOURCE.search(reply or '')
+    return res.group(1).strip() if res else None
+
+
 def _get_rtp_info(reply):
     """ Search "RTP-Info" string in rtsp reply
     """
     if not reply:
         return
-    res = re.match(r'.+?\r\n(RTP-Info: .+?)\r\n', reply, re.DOTALL)
+    res = _RTP_INFO.search(reply, 1)
     if not res:
         raise RuntimeError('Invalid RTP-Info')
-    rtp_info = res.group(1)
 
-    seq = re.findall(r';seq=(\d+)', rtp_info)
-    rtptime = re.findall(r';rtptime=(\d+)', rtp_info)
+    seq, rtptime = [], []
+    for name, value in _RTP_INFO_PARAM.findall(res.group(1)):
+        (seq if name == 'seq' else rtptime).append(value)
     if not seq or not rtptime:
         raise RuntimeError('Invalid RTP-Info')
 
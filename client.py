@@ -1,24 +1,59 @@
 import asyncio
+import os
 import re
+import socket
 import string
 import time
 from random import choices, randrange
 from urllib.parse import unquote
 from _config import Config
 from shared import Shared
-from camera import Camera
+from camera import Camera, get_profiles
 from log import Log
+from reaper import Reaper
+from admission import Admission
+from tracer import Tracer
+from pool import Pool
+from ingest import Ingest
+from recorder import Recorder
+
+# Precompiled patterns of the clients asks parsers
+_CSEQ = re.compile(r'\r\nCSeq: (\d+)')
+_USER_AGENT = re.compile(r'\r\nUser-Agent: ([ -~]+)\r\n', re.IGNORECASE)
+_PORTS = re.compile(r'\nTransport:[^\n]+client_port=(\d+)-(\d+)')
+
+_CRLF = '\r\n'  # f-string expressions can't contain backslashes before Python 3.12
 
 
 class Client:
+    __slots__ = (
+        'reader', 'writer', 'host', 'tcp_port', 'camera_hash', 'profile', 'stream', 'session_id', 'udp_ports',
+        'alive', 'slot', 'client_type', 'cseq', 'user_agent', 'queue', 'queued', 'flush_handle', 'buffered',
+        'slabs', 'trace', 'loop', 'moving', 'closing', 'recorder')
+
+    # TCP mode: coalesce interleaved frames into one write (0 bytes for a write per frame)
+    coalesce_bytes = Config.tcp_coalesce_bytes if hasattr(Config, 'tcp_coalesce_bytes') else 65536
+    coalesce_secs = (Config.tcp_coalesce_ms if hasattr(Config, 'tcp_coalesce_ms') else 0) / 1000
+
     def __init__(self, reader, writer):
         self.reader = reader
         self.writer = writer
         peername = writer.get_extra_info('peername')
         self.host = peername[0]
         self.tcp_port = peername[1]
-        self.camera_hash, self.session_id = None, None
+        self.camera_hash, self.profile, self.stream, self.session_id = None, None, None, None
         self.udp_ports = {}
+        self.alive, self.slot = time.monotonic(), None
+        self.client_type = None
+        self.cseq, self.user_agent = None, None
+        self.queue, self.queued, self.flush_handle = [], 0, None
+        self.buffered = 0  # TCP mode: the socket's write buffer size on the previous frame
+        self.slabs = []  # Pool's buffers held by queued frames (zero-copy mode)
+        self.trace = None
+        self.loop = None  # The socket's event loop, None for the main one
+        self.moving = False  # TCP mode: the socket is moving to the camera's loop
+        self.closing = False  # TCP mode: the lost connection is being closed by the main loop
+        self.recorder = False  # The server's own recorder, see Recorder.token
 
     @staticmethod
     async def listen():
@@ -41,10 +76,19 @@ class Client:
             return
 
         option = await self._request(ask)
-        self.session_id = _get_session_id(ask)
+
+        # The session ID is given once, asks without the "Session" header keep it
+        session_id = _get_session_id(ask)
+        if session_id:
+            self.session_id = session_id
+        elif not self.session_id:
+            self.session_id = ''.join(choices(string.ascii_lowercase + string.digits, k=9))
+
+        # Any request (OPTIONS or GET_PARAMETER usually) is a keepalive
+        self.touch()
 
         if option == 'OPTIONS':
-            await self._response('Public: OPTIONS, DESCRIBE, SETUP, TEARDOWN, PLAY')
+            await self._response('Public: OPTIONS, DESCRIBE, SETUP, TEARDOWN, PLAY, GET_PARAMETER, SET_PARAMETER')
 
         if option == 'DESCRIBE':
             sdp = self._get_description()
@@ -57,13 +101,24 @@ class Client:
         elif option == 'SETUP':
             await self._response(
                 self._get_transport_line(ask),
-                f'Session: {self.session_id};timeout=60')
+                f'Session: {self.session_id};timeout={Reaper.timeout}')
 
         elif option == 'PLAY':
-            # Now we are ready to share this instance
-            Shared.data[self.camera_hash]['clients'][self.session_id] = self
+            # A repeated PLAY of the session (UDP mode) is admitted already, the recorder is never refused
+            if not self.client_type and not self.recorder and not Admission.join(self, _get_client_type(self.host)):
+                info = f'Client: not enough bandwidth [{self.camera_hash}] [{self.profile}] [{self.host}]'
+                Log.write(info, self.host)
+                await self._response(f'Session: {self.session_id}', status='453 Not Enough Bandwidth')
+                return  # The client may retry or leave, the camera is released on its close
 
-            camera = Shared.data[self.camera_hash]['camera']
+            camera = self.stream.camera
+
+            # TCP mode: the camera's loop writes to the socket only after it moves there
+            self.moving = Config.tcp_mode and camera.loop is not None
+
+            # Now we are ready to share this instance
+            self.stream.subscribe(self)
+            Reaper.add(self)
 
             # Start camera's playing before client's playing because we need to get RTP info first
             await camera.play()
@@ -75,30 +130,121 @@ class Client:
 
             await self._response(*res)
 
-            await self._check_web_limit()
-
-            info = f'Client: play [{self.camera_hash}] [{self.session_id}] [{self.host}] {self.user_agent}'
+            info = f'Client: play [{self.camera_hash}] [{self.profile}] [{self.session_id}] [{self.host}] ' \
+                f'{self.user_agent}'
             Log.write(info, self.host)
 
             # In TCP mode we'll stop listening rtsp
             if Config.tcp_mode:
+                if self.moving:
+                    await self._move(camera.loop)
                 return True  # Handling is over, stop self._handle loop
 
         elif option == 'TEARDOWN':
             await self._response(f'Session: {self.session_id}')
 
-    async def write(self, frame):
-        if self.writer.transport.is_closing():
-            await self.close()
+        elif option in ('GET_PARAMETER', 'SET_PARAMETER'):
+            await self._response(f'Session: {self.session_id}')
+
+    def write(self, frame, slab=None):
+        """ Forward interleaved data (TCP mode).
+            Frames are queued till the end of the event loop tick (or "tcp_coalesce_ms")
+            or till "tcp_coalesce_bytes", then flushed with one write.
+            In zero-copy mode frames are slices of the pool's slab
+        """
+        if self.moving:
+            return
+        transport = self.writer.transport
+        if transport.is_closing():
+            # Only once, the main loop unsubscribes the client a bit later
+            if not self.closing:
+                self.closing = True
+                Ingest.spawn(self.close())
+            return
+        # The client is alive while it reads the stream: its socket buffer is empty or drained since the last frame
+        buffered = transport.get_write_buffer_size()
+        if not buffered or buffered < self.buffered:
+            self.touch()
+        self.buffered = buffered
+
+        if not Client.coalesce_bytes:
+            transport.write(frame)
+            if slab and transport.get_write_buffer_size():
+                slab.pinned = True
             return
-        self.writer.write(frame)
+
+        self.queue.append(frame)
+        self.queued += len(frame)
+        if slab and (not self.slabs or self.slabs[-1] is not slab):
+            slab.refs += 1
+            self.slabs.append(slab)
+
+        if self.queued >= Client.coalesce_bytes:
+            self.flush()
+        elif not self.flush_handle:
+            loop = asyncio.get_running_loop()
+            if Client.coalesce_secs:
+                self.flush_handle = loop.call_later(Client.coalesce_secs, self.flush)
+            else:
+                self.flush_handle = loop.call_soon(self.flush)
+
+    def flush(self):
+        """ Write queued frames with one (vectored) write
+        """
+        if self.flush_handle:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        if not self.queue:
+            return
+        transport = self.writer.transport
+        if not transport.is_closing():
+            transport.writelines(self.queue)
+        self.queue.clear()
+        self.queued = 0
+
+        if self.slabs:
+            # Unsent data may be kept by the transport as slices of the slabs
+            pinned = transport.get_write_buffer_size() > 0
+            for slab in self.slabs:
+                slab.pinned = slab.pinned or pinned
+                Pool.release(slab)
+            self.slabs.clear()
+        if self.trace:
+            self.trace.flushed(self)
+
+    def touch(self):
+        """ Refresh session liveness
+        """
+        self.alive = time.monotonic()
 
     async def close(self):
-        if not self.camera_hash:
+        if not self.stream:
             return
-        clients = Shared.data[self.camera_hash]['clients']
-        if not self.session_id or self.session_id not in clients:
+        if self in self.stream.pending:
+            # Left before PLAY: the camera may be left without anybody
+            self.stream.pending.discard(self)
+            await self._release_camera()
             return
+        if self not in self.stream.clients:
+            return
+
+        self.stream.unsubscribe(self)
+        Reaper.remove(self)
+        Admission.leave(self)
+        await Ingest.run(self.loop, self._close_writer())
+
+        Log.write(f'Client closed [{self.camera_hash}] [{self.profile}] [{self.session_id}] [{self.host}]', self.host)
+
+        # If last client is closed, close the camera connection too
+        await self._release_camera()
+
+    async def _close_writer(self):
+        """ Flush and close the socket on its loop
+        """
+        self.flush()
+        if self.trace:
+            self.trace.forget(self)
+
         try:
             if not self.writer.transport.is_closing():
                 self.writer.close()
@@ -106,22 +252,43 @@ class Client:
         except (Exception,):
             pass
 
-        del clients[self.session_id]
+    async def _move(self, loop):
+        """ TCP mode: hand the socket over to the camera's loop, the fan-out never crosses threads.
+            The main loop doesn't read the socket after PLAY anyway
+        """
+        transport = self.writer.transport
+        while transport.get_write_buffer_size() and not transport.is_closing():
+            await asyncio.sleep(0.01)  # The PLAY reply must leave the old transport first
+        if transport.is_closing():
+            await self.close()
+            return
 
-        Log.write(f'Client closed [{self.camera_hash}] [{self.session_id}] [{self.host}]', self.host)
+        sock = transport.get_extra_info('socket')
+        sock = socket.socket(sock.family, sock.type, sock.proto, os.dup(sock.fileno()))
+        transport.abort()  # Closes only its own descriptor, the connection stays open
+        self.loop = loop
+        await Ingest.run(loop, self._attach(sock))
 
-        # If last client is closed, close the camera connection too
-        if not clients:
-            try:
-                await Shared.data[self.camera_hash]['camera'].close()
-            except Exception as e:
-                Log.print(f"Client: error: can't close the camera {self.camera_hash}: {e}")
-            Shared.data[self.camera_hash]['camera'] = None
+    async def _attach(self, sock):
+        self.reader, self.writer = await asyncio.open_connection(sock=sock)
+        self.moving = False
+
+    async def _release_camera(self):
+        """ Close the camera connection if nobody watches it or sets up a session
+        """
+        stream = self.stream
+        if stream.clients or stream.pending or not stream.camera:
+            return
+        try:
+            await stream.camera.close()
+        except Exception as e:
+            Log.print(f"Client: error: can't close the camera {self.camera_hash} [{self.profile}]: {e}")
+        stream.camera = None
 
     def _get_rtp_info(self):
         """ Build new "RTP-Info" line (for UDP mode only)
         """
-        camera = Shared.data[self.camera_hash]['camera']
+        camera = self.stream.camera
         rtp_info = camera.rtp_info
         if not rtp_info:
             return
@@ -159,32 +326,34 @@ class Client:
 
         option = res.group(1)
 
-        if not self.camera_hash:
-            camera_hash = unquote(res.group(2))
-            if camera_hash not in Config.cameras:
-                raise RuntimeError('invalid camera hash')
+        # OPTIONS carries no "Bandwidth", the profile is chosen on the next ask (DESCRIBE usually)
+        if not self.camera_hash and option != 'OPTIONS':
+            camera_hash, profile = _get_stream(unquote(res.group(2)))
 
             self.camera_hash = camera_hash
+            self.recorder = f'\r\nX-Recorder: {Recorder.token}\r\n' in ask
+            self.profile = profile or ('main' if self.recorder else self._select_profile(ask))
+
+            self.stream = Shared.streams[camera_hash][self.profile]
+            self.stream.pending.add(self)
+            self.trace = Tracer.get(camera_hash, self.profile)
 
             # Create the camera connection if not exists
-            if not Shared.data[camera_hash]['camera']:
-                camera = Camera(camera_hash)
+            if not self.stream.camera:
+                camera = Camera(camera_hash, self.profile)
                 await camera.connect()
 
-                Shared.data[camera_hash]['camera'] = camera
+                self.stream.camera = camera
 
         return option
 
-    async def _response(self, *lines):
+    async def _response(self, *lines, status='200 OK'):
         """ Reply to client with given params
         """
-        reply = 'RTSP/1.0 200 OK\r\n' \
-            f'CSeq: {self.cseq}\r\n'
-
-        for row in lines:
-            reply += f'{row}\r\n'
-
-        reply += '\r\n'
+        if lines:
+            reply = f'RTSP/1.0 {status}\r\nCSeq: {self.cseq}\r\n{_CRLF.join(lines)}\r\n\r\n'
+        else:
+            reply = f'RTSP/1.0 {status}\r\nCSeq: {self.cseq}\r\n\r\n'
 
         self.writer.write(reply.encode())
 
@@ -203,49 +372,48 @@ class Client:
         idx = 0 if not self.udp_ports else 1
         self.udp_ports[idx] = udp_ports
 
-        return f'Transport: RTP/AVP;unicast;client_port={udp_ports[0]}-{udp_ports[1]};server_port=5998-5999'
+        # Clients send RTCP receiver reports to the server ports, they keep the session alive
+        server_ports = self.stream.camera.server_ports[idx]
+
+        return 'Transport: RTP/AVP;unicast;' \
+            f'client_port={udp_ports[0]}-{udp_ports[1]};server_port={server_ports[0]}-{server_ports[1]}'
 
     def _get_description(self):
-        """ Create new SDP based on original one from the camera
+        """ Create new SDP based on original one from the camera.
+            The media part is the same for all clients of the camera, it's built once
         """
-        sdp = Shared.data[self.camera_hash]['camera'].description
-        res = 'v=0\r\n' \
+        camera = self.stream.camera
+        if camera.sdp is None:
+            camera.sdp = _get_media_description(camera.description)
+        return 'v=0\r\n' \
             f'o=- {randrange(100000, 999999)} {randrange(1, 10)} IN IP4 {Config.local_ip}\r\n' \
             's=python-rtsp-server\r\n' \
-            't=0 0'
+            f't=0 0{camera.sdp}'
         # 'a=range:npt=0-'
 
-        if not sdp['video']:
-            return res
-        res += f'\r\nm=video {sdp["video"]["media"]}\r\n' \
-            'c=IN IP4 0.0.0.0\r\n' \
-            f'b={sdp["video"]["bandwidth"]}\r\n' \
-            f'a=rtpmap:{sdp["video"]["rtpmap"]}\r\n' \
-            f'a=fmtp:{sdp["video"]["format"]}\r\n' \
-            'a=control:track1'
-
-        if not sdp['audio']:
-            return res
-        res += f'\r\nm=audio {sdp["audio"]["media"]}\r\n' \
-            f'a=rtpmap:{sdp["audio"]["rtpmap"]}\r\n' \
-            'a=control:track2'
-        return res
-
-    async def _check_web_limit(self):
-        """ Just drop old "external" connections
+    def _select_profile(self, ask):
+        """ Web clients, clients with low bandwidth and clients over the bandwidth budget
+            get the camera's "web_profile" (if any)
         """
-        if not Config.web_limit or _get_client_type(self.host) == 'local':
-            return
-        web_sessions = []
-        clients = Shared.data[self.camera_hash]['clients']
-        for session_id, client in clients.items():
-            if _get_client_type(client.host) == 'web':
-                web_sessions.append(session_id)
-        if len(web_sessions) > Config.web_limit:
-            ws = web_sessions[:-Config.web_limit]
-            for session_id in ws:
-                Log.write('Client: web limit exceeded, close old connection')
-                await clients[session_id].close()
+        cfg = Config.cameras[self.camera_hash]
+        if 'web_profile' not in cfg or not cfg['web_profile']:
+            return 'main'
+
+        client_type = _get_client_type(self.host)
+        if client_type == 'web':
+            return cfg['web_profile']
+
+        low_bandwidth = Config.low_bandwidth if hasattr(Config, 'low_bandwidth') else 0
+        bandwidth = _get_bandwidth(ask)
+        if bandwidth and bandwidth < low_bandwidth:
+            return cfg['web_profile']
+
+        if not Admission.fits(self.camera_hash, 'main', client_type):
+            Log.write(f'Client: bandwidth budget exceeded, downgrade to "{cfg["web_profile"]}" [{self.camera_hash}] '
+                      f'[{self.host}]', self.host)
+            return cfg['web_profile']
+
+        return 'main'
 
 
 async def _handle(reader, writer):
@@ -272,6 +440,25 @@ async def _handle(reader, writer):
             return
 
 
+def _get_media_description(sdp):
+    """ Media part of the clients' SDP based on the camera's one
+    """
+    if not sdp['video']:
+        return ''
+    res = f'\r\nm=video {sdp["video"]["media"]}\r\n' \
+        'c=IN IP4 0.0.0.0\r\n' \
+        f'b={sdp["video"]["bandwidth"]}\r\n' \
+        f'a=rtpmap:{sdp["video"]["rtpmap"]}\r\n' \
+        f'a=fmtp:{sdp["video"]["format"]}\r\n' \
+        'a=control:track1'
+
+    if not sdp['audio']:
+        return res
+    return f'{res}\r\nm=audio {sdp["audio"]["media"]}\r\n' \
+        f'a=rtpmap:{sdp["audio"]["rtpmap"]}\r\n' \
+        'a=control:track2'
+
+
 def _get_session_id(ask):
     """ Search session ID in rtsp ask
     """
@@ -279,13 +466,11 @@ def _get_session_id(ask):
     if res:
         return res.group(1).strip()
 
-    return ''.join(choices(string.ascii_lowercase + string.digits, k=9))
-
 
 def _get_cseq(ask):
     """ Search CSeq in rtsp ask
     """
-    res = re.match(r'.+?\r\nCSeq: (\d+)', ask, re.DOTALL)
+    res = _CSEQ.search(ask, 1)
     if not res:
         raise RuntimeError('invalid incoming CSeq')
     return int(res.group(1))
@@ -295,16 +480,40 @@ def _get_user_agent(ask):
     """ Search User-Agent in rtsp ask
         [ -~] means any ASCII character from the space to the tilde
     """
-    res = re.match(r'.+?\r\nUser-Agent: ([ -~]+)\r\n', ask, re.DOTALL + re.IGNORECASE)
+    res = _USER_AGENT.search(ask, 1)
     if not res:
         return 'unknown user agent'
     return res.group(1)
 
 
+def _get_bandwidth(ask):
+    """ Search "Bandwidth" (bits per second) in rtsp ask
+    """
+    res = re.match(r'.+?\r\nBandwidth: *(\d+)', ask, re.DOTALL + re.IGNORECASE)
+    if not res:
+        return 0
+    return int(res.group(1))
+
+
+def _get_stream(path):
+    """ Split the requested path into camera hash and optional profile name, i.e. "camera-hash/sub"
+    """
+    if path in Config.cameras:
+        return path, None
+
+    camera_hash, _, profile = path.rpartition('/')
+    if camera_hash not in Config.cameras:
+        raise RuntimeError('invalid camera hash')
+    if profile not in get_profiles(camera_hash):
+        raise RuntimeError('invalid camera profile')
+
+    return camera_hash, profile
+
+
 def _get_ports(ask):
     """ Search port numbers in rtsp ask
     """
-    res = re.match(r'.+?\nTransport:[^\n]+client_port=(\d+)-(\d+)', ask, re.DOTALL)
+    res = _PORTS.search(ask, 1)
     if not res:
         raise RuntimeError('invalid transport ports')
     return [int(res.group(1)), int(res.group(2))]
@@ -4,7 +4,7 @@ import socket
 class Config:
     rtsp_host = '0.0.0.0'  # Client listener host
     rtsp_port = 4554       # Client listener port
-    start_udp_port = 5550
+    start_udp_port = 5550  # First port of the pool for cameras' UDP streams (four ports per track)
     local_ip = socket.gethostbyname(socket.gethostname())
 
     # Camera(s) settings.
@@ -18,11 +18,20 @@ class Config:
     #           mencoder {url} -ovc copy -o {filename}.avi
     #           openRTSP -b 10000000 -i -w 1920 -h 1080 -f 15 {url} > {filename}.avi
     #       Note that these utilities aren't included and must be installed yourself.
+    #    * Optional: "profiles" are substreams of the camera, "url" is always the "main" profile.
+    #       Clients can request the profile explicitly: rtsp://<server>:4554/<camera hash>/<profile name>
+    #    * Optional: "web_profile" is the default profile for web clients
+    #       and for clients with "Bandwidth" lower than "low_bandwidth" or over the "bandwidth_limits".
+    #    * Optional: "bandwidth_limit" is the egress budget for all clients of the camera, kbit/s.
+    #    * Optional: "jitter_buffer_ms" and "storage_activity" override the same named global settings.
     #
     cameras = {
         'some-URL-compatible-string/including-UTF-characters': {
             'path': 'some folder in the storage_path',
             'url': 'rtsp://[<login>:<password>@]<IP or host name>[:554][/<uri>]',
+            # 'profiles': {'sub': 'rtsp://[<login>:<password>@]<IP or host name>[:554][/<substream uri>]'},
+            # 'web_profile': 'sub',
+            # 'bandwidth_limit': 20000,
             # 'storage_command': 'any *nix command for saving rtsp stream to a file',
         },
     }
@@ -30,9 +39,37 @@ class Config:
     # Force UDP or TCP protocol globally
     tcp_mode = False
 
-    # Limit connections from the web. Set to 0 for unlimited connections
+    # TCP mode: frames for each client are coalesced into one write till the end of the event loop tick,
+    # or up to "tcp_coalesce_ms" (0 for the tick only), or up to "tcp_coalesce_bytes" (0 for a write per frame)
+    tcp_coalesce_bytes = 65536
+    tcp_coalesce_ms = 0
+
+    # Limit connections from the web to each camera, new connections over the limit are refused.
+    # Set to 0 for unlimited connections
     web_limit = 2
 
+    # Egress bandwidth budgets for the whole server and for each client type, kbit/s.
+    # New sessions over a budget are downgraded to the "web_profile" or refused. Set to 0 for unlimited bandwidth
+    bandwidth_limits = {'total': 0, 'web': 0, 'local': 0}
+
+    # Clients announcing lower bandwidth (RTSP "Bandwidth" header, bits/s) get the "web_profile". Set to 0 to disable
+    low_bandwidth = 0
+
+    # Close client sessions without keepalive requests or RTCP reports, secs
+    session_timeout = 60
+
+    # Receive cameras' streams into preallocated buffers and forward them without copying
+    zero_copy = False
+
+    # Event loop threads for cameras' streams, each camera goes to the least loaded one by bitrate.
+    # Set to 0 to run everything on the main loop
+    ingest_threads = 0
+
+    # UDP mode: reorder packets from cameras by RTP sequence number and drop duplicates.
+    # Max added latency, ms (set to 0 for pass-through) and max packets held for each track
+    jitter_buffer_ms = 0
+    jitter_buffer_packets = 64
+
     # Check UDP traffic from cameras, secs
     watchdog_interval = 30
 
@@ -50,4 +87,21 @@ class Config:
     # storage_command = 'ffmpeg -rtsp_transport tcp -i {url} -c copy -v fatal -t {storage_fragment_secs} {filename}.mkv'
     storage_enable = False
 
+    # Activity-gated recording instead of the "storage_command": the server records the video track itself
+    # into H.264/H.265 elementary stream files (.h264, .h265), no audio. Inter frames "storage_activity_ratio" times
+    # bigger than usual mean motion: the stream is recorded at full rate, with "storage_preroll_secs" before
+    # and "storage_activity_hold_secs" after the motion. Idle cameras keep a keyframe every "storage_idle_keyframe_secs"
+    storage_activity = False
+    storage_activity_ratio = 1.5
+    storage_activity_hold_secs = 10
+    storage_preroll_secs = 5
+    storage_idle_keyframe_secs = 10
+
+    # Latency histograms of the packets path, "kill -USR2 <pid>" writes them to the log. Adds some CPU load
+    trace_enable = False
+
+    # "kill -USR1 <pid>" samples stacks of the running server into "profile_path" folder
+    profile_secs = 10
+    profile_path = '/tmp'
+
     debug = True
@@ -0,0 +1,74 @@
+import asyncio
+import threading
+from _config import Config
+from admission import Admission
+
+
+class Ingest:
+    """ Event loop threads for the cameras' ingest and fan-out ("ingest_threads" in the configuration file),
+        so one misbehaving camera can't delay the streams of others.
+        Every camera (stream profile) lives on the least loaded loop by bitrate: its RTSP connection, RTP sockets
+        and the clients' TCP sockets (moved there on PLAY). Clients' accept and RTSP control stay on the main loop.
+        Loops hand over only sessions, never packets: the data path doesn't cross threads.
+    """
+    threads = Config.ingest_threads if hasattr(Config, 'ingest_threads') else 0
+    _main = None  # The main loop
+    _loops = {}   # Cameras of every ingest loop: {loop: {camera, ...}}
+    _idents = {}  # {thread ID: name}
+
+    @staticmethod
+    def start():
+        """ Start "ingest_threads" event loops (called from the main loop)
+        """
+        Ingest._main = asyncio.get_running_loop()
+        for idx in range(Ingest.threads):
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name=f'ingest-{idx}', daemon=True)
+            thread.start()
+            Ingest._loops[loop] = set()
+            Ingest._idents[thread.ident] = thread.name
+
+    @staticmethod
+    def assign(camera):
+        """ Returns the least loaded ingest loop for the camera, None is the main loop (no ingest threads)
+        """
+        if not Ingest._loops:
+            return
+        loop = min(Ingest._loops, key=Ingest._load)
+        Ingest._loops[loop].add(camera)
+        return loop
+
+    @staticmethod
+    def release(camera):
+        if camera.loop:
+            Ingest._loops[camera.loop].discard(camera)
+
+    @staticmethod
+    async def run(loop, coro):
+        """ Run the coroutine on given loop and wait for the result on the current one
+        """
+        if not loop or loop is asyncio.get_running_loop():
+            return await coro
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, loop))
+
+    @staticmethod
+    def spawn(coro):
+        """ Start the coroutine on the main loop from any thread
+        """
+        if not Ingest._main or Ingest._main is asyncio.get_running_loop():
+            asyncio.create_task(coro)
+        else:
+            asyncio.run_coroutine_threadsafe(coro, Ingest._main)
+
+    @staticmethod
+    def thread_names():
+        """ Ingest threads for the profiler: {thread ID: name}
+        """
+        return dict(Ingest._idents)
+
+    @staticmethod
+    def _load(loop):
+        """ Measured bitrate of the loop's cameras, then their number for the not measured ones
+        """
+        cameras = Ingest._loops[loop]
+        return sum(Admission.bitrate(camera.hash, camera.profile) for camera in cameras), len(cameras)
@@ -0,0 +1,166 @@
+import asyncio
+import time
+
+
+class JitterBuffer:
+    """ Reorder RTP packets of one track by sequence number and drop duplicates.
+        A packet waits for the missing ones at most "window" secs, the buffer holds at most "size" packets;
+        missing packets are counted as lost then.
+        A jump of the sequence beyond "size" packets is followed only after "min_sequential" packets in a row
+        (RFC 3550 probation), a lone stray packet is dropped. The jump, or "max_late" late packets in a row,
+        mean the camera restarted its sequence: the buffer is flushed and follows the new sequence.
+        Every packet is forwarded with its stamp given on push (receive time of the tracer).
+    """
+    __slots__ = ('forward', 'window', 'size', 'expected', 'highest', 'packets', 'timer', 'late_run', 'probation',
+                 'lost', 'reordered', 'duplicates', 'late', 'strays', 'resyncs')
+
+    max_late = 16
+    min_sequential = 2  # RFC 3550 MIN_SEQUENTIAL
+
+    def __init__(self, forward, window, size):
+        self.forward = forward  # Callback for released packets
+        self.window = window
+        self.size = size
+        self.expected = None  # Sequence number of the next packet to release
+        self.highest = None   # The highest sequence number seen
+        self.packets = {}     # Held packets: {seq: (data, arrival time, stamp)}
+        self.timer = None
+        self.late_run = 0     # Late packets in a row
+        self.probation = []   # Packets in a row beyond the jump: [(seq, data, stamp)]
+        self.lost, self.reordered, self.duplicates, self.late, self.strays, self.resyncs = 0, 0, 0, 0, 0, 0
+
+    def push(self, data, stamp=None):
+        # Not an RTP packet, nothing to reorder
+        if len(data) < 12 or data[0] >> 6 != 2:
+            self.forward(data, stamp)
+            return
+
+        seq = (data[2] << 8) | data[3]
+
+        if self.expected is None:
+            self.expected = self.highest = seq
+
+        ahead = (seq - self.expected) & 0xFFFF
+        if ahead > self.size and 0x10000 - ahead > self.size:
+            # The sequence jumped, or a stray packet came
+            self._probe(seq, data, stamp)
+            return
+        if ahead >= 0x8000:
+            # Released or given up already, unless the sequence jumped back a bit
+            self.late_run += 1
+            if self.late_run < JitterBuffer.max_late:
+                self.late += 1
+                return
+            self._resync(seq)
+        else:
+            self.late_run = 0
+
+        if self.probation:
+            # The old sequence goes on, the packets beyond the jump were strays
+            self.strays += len(self.probation)
+            self.probation = []
+
+        if seq == self.expected and not self.packets:
+            # In order, the most usual case
+            self.expected = (seq + 1) & 0xFFFF
+            self.highest = seq
+            self.forward(data, stamp)
+            return
+
+        if seq in self.packets:
+            self.duplicates += 1
+            return
+
+        if (seq - self.highest) & 0xFFFF < 0x8000:
+            self.highest = seq
+        else:
+            self.reordered += 1  # Came after a later one
+        # A memoryview (zero-copy mode) can't outlive its buffer
+        self.packets[seq] = (bytes(data), time.monotonic(), stamp)
+
+        released = self._release()
+
+        if len(self.packets) > self.size:
+            self._skip()
+            released = self._release()
+
+        # The first gap is still the same, keep its timer
+        if released or not self.timer:
+            self._schedule()
+
+    def close(self):
+        if self.timer:
+            self.timer.cancel()
+            self.timer = None
+        self.packets = {}
+
+    def stats(self):
+        return f'lost {self.lost}, reordered {self.reordered}, duplicates {self.duplicates}, late {self.late}, ' \
+            f'strays {self.strays}, resyncs {self.resyncs}'
+
+    def _release(self):
+        """ Forward all packets in order up to the first gap, returns False if there was nothing to forward
+        """
+        if self.expected not in self.packets:
+            return False
+        while self.expected in self.packets:
+            data, _arrival, stamp = self.packets.pop(self.expected)
+            self.expected = (self.expected + 1) & 0xFFFF
+            self.forward(data, stamp)
+        return True
+
+    def _probe(self, seq, data, stamp):
+        """ Hold the packet beyond the jump till "min_sequential" packets in a row follow the new sequence
+        """
+        if self.probation and seq != (self.probation[-1][0] + 1) & 0xFFFF:
+            self.strays += len(self.probation)
+            self.probation = []
+        # A memoryview (zero-copy mode) can't outlive its buffer
+        self.probation.append((seq, bytes(data), stamp))
+        if len(self.probation) < JitterBuffer.min_sequential:
+            return
+
+        probation = self.probation
+        self._resync(probation[0][0])
+        for seq, data, stamp in probation:
+            self.forward(data, stamp)
+        self.expected = (seq + 1) & 0xFFFF
+        self.highest = seq
+
+    def _resync(self, seq):
+        """ Forward the held packets and start over from the given sequence number
+        """
+        for held in sorted(self.packets, key=lambda s: (s - self.expected) & 0xFFFF):
+            data, _arrival, stamp = self.packets[held]
+            self.forward(data, stamp)
+        self.close()
+        self.probation = []
+        self.expected = self.highest = seq
+        self.late_run = 0
+        self.resyncs += 1
+
+    def _skip(self):
+        """ Give up waiting for the first gap
+        """
+        seq = min(self.packets, key=lambda s: (s - self.expected) & 0xFFFF)
+        self.lost += (seq - self.expected) & 0xFFFF
+        self.expected = seq
+
+    def _schedule(self):
+        """ Wake up when the packet after the first gap waits too long
+        """
+        if self.timer:
+            self.timer.cancel()
+            self.timer = None
+        if not self.packets:
+            return
+
+        seq = min(self.packets, key=lambda s: (s - self.expected) & 0xFFFF)
+        delay = self.packets[seq][1] + self.window - time.monotonic()
+        self.timer = asyncio.get_running_loop().call_later(max(delay, 0), self._timeout)
+
+    def _timeout(self):
+        self.timer = None
+        self._skip()
+        self._release()
+        self._schedule()
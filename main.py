@@ -1,27 +1,109 @@
 import asyncio
+import copy
+import importlib
+import signal
+import _config
 from _config import Config
 from client import Client
 from storage import Storage
-from shared import Shared
+from shared import Shared, Stream
+from camera import get_profiles
+from reaper import Reaper
+from admission import Admission
+from log import Log
+from tracer import Tracer
+from profiler import Profiler
+from ingest import Ingest
+
+# Storage tasks of every camera: {camera_hash: [task, ...]}
+_storage_tasks = {}
 
 
 async def main():
+    # Event loop threads for the cameras, if any
+    Ingest.start()
+
     # Start one listener for all clients
     tasks = [asyncio.create_task(Client.listen())]
 
+    # Close sessions of vanished clients
+    tasks.append(asyncio.create_task(Reaper.run()))
+
+    # Measure streams bitrate for bandwidth budgets
+    tasks.append(asyncio.create_task(Admission.run()))
+
     for camera_hash in Config.cameras.keys():
-        # All tasks will communicate through this object
-        Shared.data[camera_hash] = {'camera': None, 'clients': {}}
+        _start_camera(camera_hash)
+
+    # Reload the configuration without restart: kill -HUP <pid>
+    loop = asyncio.get_running_loop()
+    loop.add_signal_handler(signal.SIGHUP, lambda: asyncio.create_task(_reload()))
 
-        # Start streams saving, if enabled
-        if Config.storage_enable:
-            s = Storage(camera_hash)
-            tasks.append(asyncio.create_task(s.run()))
-            tasks.append(asyncio.create_task(s.watchdog()))
+    # Diagnostics: kill -USR1 <pid> samples stacks, kill -USR2 <pid> writes latency histograms to the log
+    loop.add_signal_handler(signal.SIGUSR1, Profiler.start)
+    loop.add_signal_handler(signal.SIGUSR2, Tracer.report)
 
     for t in tasks:
         await t
 
 
+def _start_camera(camera_hash):
+    # One connection per stream profile, created on demand
+    Shared.streams[camera_hash] = {profile: Stream(camera_hash, profile) for profile in get_profiles(camera_hash)}
+
+    # Start streams saving, if enabled
+    if Config.storage_enable:
+        s = Storage(camera_hash)
+        _storage_tasks[camera_hash] = [asyncio.create_task(s.run()), asyncio.create_task(s.watchdog())]
+
+
+async def _stop_camera(camera_hash):
+    """ Close all clients and connections of the camera
+    """
+    for t in _storage_tasks.pop(camera_hash, []):
+        t.cancel()
+
+    for profile, stream in Shared.streams[camera_hash].items():
+        for client in list(stream.clients):
+            await client.close()
+
+        # Connected, but not playing yet
+        if stream.camera:
+            try:
+                await stream.camera.close()
+            except Exception as e:
+                Log.print(f"Main: error: can't close the camera {camera_hash} [{profile}]: {e}")
+            stream.camera = None  # Clients in the handshake must not close it again
+
+    del Shared.streams[camera_hash]
+
+
+async def _reload():
+    """ Re-read _config.py, then stop and start only changed cameras
+    """
+    old_cameras = copy.deepcopy(Config.cameras)
+    try:
+        # Other modules hold the Config class itself, so update its attributes
+        new_config = importlib.reload(_config).Config
+        for name, value in vars(new_config).items():
+            if not name.startswith('__'):
+                setattr(Config, name, value)
+    except Exception as e:
+        Log.write(f"Main: can't reload configuration: {e}")
+        return
+
+    for camera_hash, cfg in old_cameras.items():
+        if Config.cameras.get(camera_hash) != cfg:
+            await _stop_camera(camera_hash)
+            Log.write(f'Main: camera stopped [{camera_hash}]')
+
+    for camera_hash, cfg in Config.cameras.items():
+        if old_cameras.get(camera_hash) != cfg:
+            _start_camera(camera_hash)
+            Log.write(f'Main: camera started [{camera_hash}]')
+
+    Log.write('Main: configuration reloaded')
+
+
 if __name__ == '__main__':
     asyncio.run(main())
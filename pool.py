@@ -0,0 +1,33 @@
+class Pool:
+    """ Preallocated buffers for the zero-copy ingest ("zero_copy" in the configuration file).
+        Packets are memoryview slices of a slab; the slab returns to the pool
+        when the last holder releases it, unless a socket kept a slice in its buffer.
+    """
+    slab_size = 256 * 1024
+    max_free = 64
+    _free = []
+
+    @staticmethod
+    def get():
+        try:
+            slab = Pool._free.pop()  # Atomic, ingest threads share the pool
+        except IndexError:
+            slab = Slab(Pool.slab_size)
+        slab.refs, slab.pinned = 1, False
+        return slab
+
+    @staticmethod
+    def release(slab):
+        slab.refs -= 1
+        if slab.refs or slab.pinned or len(Pool._free) >= Pool.max_free:
+            return
+        Pool._free.append(slab)
+
+
+class Slab:
+    __slots__ = ('view', 'refs', 'pinned')
+
+    def __init__(self, size):
+        self.view = memoryview(bytearray(size))
+        self.refs = 0
+        self.pinned = False  # Some transport holds a slice, leave the slab to the garbage collector
@@ -0,0 +1,60 @@
+import sys
+import threading
+import time
+from collections import Counter
+from _config import Config
+from log import Log
+from ingest import Ingest
+
+
+class Profiler:
+    """ Sample stacks of the running server for "profile_secs" without restart: kill -USR1 <pid>.
+        The result is in "folded" format, ready for flamegraph.pl or speedscope.
+        A sampler thread lives only during the capture, so the idle profiler costs nothing.
+    """
+    interval = 0.005  # Sampling period, secs
+    _thread = None
+
+    @staticmethod
+    def start():
+        if Profiler._thread and Profiler._thread.is_alive():
+            Log.write('Profiler: capture is already running')
+            return
+
+        secs = Config.profile_secs if hasattr(Config, 'profile_secs') else 10
+        path = Config.profile_path if hasattr(Config, 'profile_path') else '/tmp'
+        filename = f'{path}/python-rtsp-server-{time.strftime("%Y-%m-%d-%H:%M:%S")}.folded'
+
+        # The main loop and the ingest ones, if any
+        threads = {threading.get_ident(): 'main', **Ingest.thread_names()}
+        Profiler._thread = threading.Thread(target=_capture, args=(threads, secs, filename), daemon=True)
+        Profiler._thread.start()
+        Log.write(f'Profiler: capture {secs} secs to {filename}')
+
+
+def _capture(threads, secs, filename):
+    """ Count stacks of given threads ({thread ID: name}), outermost frame first, the thread's name is the root
+    """
+    stacks = Counter()
+    end = time.monotonic() + secs
+    while time.monotonic() < end:
+        frames = sys._current_frames()
+        for thread_id, name in threads.items():
+            frame = frames.get(thread_id)
+            stack = []
+            while frame:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({code.co_filename.rsplit("/", 1)[-1]}:{code.co_firstlineno})')
+                frame = frame.f_back
+            if stack:
+                stack.append(name)
+                stacks[';'.join(reversed(stack))] += 1
+        time.sleep(Profiler.interval)
+
+    try:
+        with open(filename, 'w') as f:
+            for stack, count in stacks.most_common():
+                f.write(f'{stack} {count}\n')
+        Log.write(f'Profiler: {sum(stacks.values())} samples saved to {filename}')
+    except Exception as e:
+        Log.write(f"Profiler: can't save {filename}: {e}")
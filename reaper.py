@@ -0,0 +1,67 @@
+import asyncio
+import time
+from _config import Config
+from log import Log
+
+
+class Reaper:
+    """ Close client sessions that stopped to show signs of life.
+        Timer wheel with one slot per second: each tick checks only one slot,
+        so every session costs O(1) per refresh and per expiration.
+    """
+    timeout = Config.session_timeout if hasattr(Config, 'session_timeout') else 60
+    _slots = [set() for _ in range(timeout + 1)]
+    _tick = 0
+
+    @staticmethod
+    def add(client):
+        """ Start tracking the session (on PLAY)
+        """
+        client.touch()
+        Reaper._put(client)
+
+    @staticmethod
+    def remove(client):
+        if client.slot is not None:
+            Reaper._slots[client.slot].discard(client)
+            client.slot = None
+
+    @staticmethod
+    async def run():
+        """ Infinite loop for sessions expiration
+        """
+        Reaper._tick = int(time.monotonic())
+        while True:
+            await asyncio.sleep(1)
+            now = time.monotonic()
+
+            # Check the slots of all passed seconds, catch up if the loop was busy longer than a tick
+            while Reaper._tick < int(now):
+                await Reaper._expire(Reaper._slots[Reaper._tick % len(Reaper._slots)], now)
+                Reaper._tick += 1
+
+    @staticmethod
+    async def _expire(slot, now):
+        """ Close expired sessions, move refreshed ones to their new slots
+        """
+        for client in list(slot):
+            if client.alive + Reaper.timeout > now:
+                Reaper._put(client)
+                continue
+
+            Reaper.remove(client)
+            Log.write(f'Reaper: session timeout [{client.camera_hash}] [{client.profile}] [{client.session_id}] '
+                      f'[{client.host}]', client.host)
+            try:
+                await client.close()
+            except Exception as e:
+                Log.print(f"Reaper: error: can't close the session {client.session_id}: {e}")
+
+    @staticmethod
+    def _put(client):
+        idx = int(client.alive + Reaper.timeout) % len(Reaper._slots)
+        if idx == client.slot:
+            return
+        Reaper.remove(client)
+        Reaper._slots[idx].add(client)
+        client.slot = idx
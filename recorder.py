@@ -0,0 +1,300 @@
+import asyncio
+import re
+import time
+from collections import deque
+from secrets import token_hex
+from urllib.parse import quote
+from _config import Config
+from log import Log
+
+
+class Recorder:
+    """ Activity-gated recording: the proxy's own client, writes H.264/H.265 elementary stream.
+        Bigger inter frames (motion) switch recording to full rate with the "pre-roll" of recent frames,
+        idle cameras keep only a keyframe every "storage_idle_keyframe_secs".
+    """
+    # Proves to the proxy that the ask comes from the recorder: it bypasses the bandwidth budgets and the profiles
+    token = token_hex(16)
+
+    def __init__(self, camera_hash, output):
+        self.hash = camera_hash
+        self.output = output  # Callback for recorded access units: output(data, key)
+        self.codec = None
+        self.cseq = 0
+        self.reader, self.writer = None, None
+        self.rest = b''
+
+        self.depacketizer = None
+        self.timestamp = None
+        self.frame_time = time.monotonic()  # The last access unit received, the storage watchdog checks it
+
+        self.recent, self.usual = None, None  # Inter frames size averages
+        self.active_until = 0
+        self.recording = False
+        self.last_key_time = 0
+        self.gops = deque()  # Pre-roll: [[(time, access unit, key), ...], ...]
+
+        self.ratio = _get_setting('storage_activity_ratio', 1.5)
+        self.hold = _get_setting('storage_activity_hold_secs', 10)
+        self.idle_keyframe = _get_setting('storage_idle_keyframe_secs', 10)
+        self.preroll = _get_setting('storage_preroll_secs', 5)
+
+    async def run(self):
+        """ Play the video track till the connection is lost
+        """
+        host = Config.rtsp_host if hasattr(Config, 'rtsp_host') and Config.rtsp_host != '0.0.0.0' else '127.0.0.1'
+        url = f'rtsp://{host}:{Config.rtsp_port}/{quote(self.hash)}'
+        self.reader, self.writer = await asyncio.open_connection(host, Config.rtsp_port)
+        transport = None
+        try:
+            await self._ask('OPTIONS', url)
+
+            reply = await self._ask('DESCRIBE', url, 'Accept: application/sdp')
+            res = re.search(r'\na=rtpmap:\d+ (H26[45])/', reply)
+            if not res:
+                raise RuntimeError('unsupported video codec')
+            self.codec = res.group(1).lower()
+            self.depacketizer = Depacketizer(self.codec)
+
+            if Config.tcp_mode:
+                reply = await self._ask('SETUP', f'{url}/track1', 'Transport: RTP/AVP/TCP;unicast;interleaved=0-1')
+            else:
+                loop = asyncio.get_running_loop()
+                transport, _protocol = await loop.create_datagram_endpoint(
+                    lambda: RecorderUdpProtocol(self), local_addr=(host, 0))
+                port = transport.get_extra_info('sockname')[1]
+                reply = await self._ask(
+                    'SETUP', f'{url}/track1', f'Transport: RTP/AVP;unicast;client_port={port}-{port + 1}')
+
+            res = re.search(r'\nSession: *([^;\r\n]+)', reply)
+            if not res:
+                raise RuntimeError('invalid session ID')
+            session = f'Session: {res.group(1)}'
+
+            reply = await self._ask('PLAY', url, session)
+            if not reply.startswith('RTSP/1.0 200'):
+                raise RuntimeError(f'can\'t play: {reply.splitlines()[0]}')
+
+            Log.print(f'Recorder: started [{self.hash}] [{self.codec}]')
+
+            if Config.tcp_mode:
+                await self._interleave()
+            else:
+                await self._keepalive(url, session)
+        finally:
+            if transport:
+                transport.close()
+            self.writer.close()
+
+    def packet(self, data):
+        """ Collect RTP packets into access units (frames)
+        """
+        if len(data) < 12 or data[0] >> 6 != 2:
+            return
+        offset = 12 + (data[0] & 0x0F) * 4
+        if data[0] & 0x10:  # Header extension
+            offset += 4 + int.from_bytes(data[offset + 2:offset + 4], 'big') * 4
+        end = len(data) - (data[-1] if data[0] & 0x20 else 0)  # Padding
+
+        timestamp = data[4:8]
+        if self.timestamp is not None and timestamp != self.timestamp:
+            self._frame()  # Marker of the previous frame is lost
+        self.timestamp = timestamp
+
+        self.depacketizer.push(data[offset:end])
+
+        if data[1] & 0x80:  # Marker: the last packet of the frame
+            self._frame()
+
+    async def _ask(self, option, url, *lines):
+        self.cseq += 1
+        ask = f'{option} {url} RTSP/1.0\r\nCSeq: {self.cseq}\r\nUser-Agent: python-rtsp-server recorder\r\n' \
+            f'X-Recorder: {Recorder.token}\r\n'
+        for row in lines:
+            ask += f'{row}\r\n'
+        self.writer.write(f'{ask}\r\n'.encode())
+
+        data = await self.reader.read(4096)
+        if not data:
+            raise RuntimeError('connection closed')
+
+        if option != 'PLAY':
+            return data.decode()
+        # Interleaved data can follow the PLAY reply
+        head, _sep, self.rest = data.partition(b'\r\n\r\n')
+        return head.decode()
+
+    async def _interleave(self):
+        """ TCP mode: read "$<channel><length><packet>" frames
+        """
+        buf, pos = self.rest, 0
+        while True:
+            while len(buf) - pos >= 4:
+                if buf[pos] != 0x24:  # "$"
+                    raise RuntimeError('invalid interleaved data')
+                size = int.from_bytes(buf[pos + 2:pos + 4], 'big')
+                if len(buf) - pos < size + 4:
+                    break
+                if buf[pos + 1] == 0:
+                    self.packet(buf[pos + 4:pos + size + 4])
+                pos += size + 4
+
+            data = await self.reader.read(65536)
+            if not data:
+                raise RuntimeError('connection closed')
+            buf, pos = buf[pos:] + data, 0
+
+    async def _keepalive(self, url, session):
+        """ UDP mode: the stream goes to RecorderUdpProtocol, keep the session alive meanwhile
+        """
+        timeout = Config.session_timeout if hasattr(Config, 'session_timeout') else 60
+        while True:
+            await asyncio.sleep(timeout / 3)
+            await self._ask('GET_PARAMETER', url, session)
+
+    def _frame(self):
+        au, key = self.depacketizer.pop()
+        self.timestamp = None
+        if not au:
+            return
+
+        now = time.monotonic()
+        self.frame_time = now
+        self._measure(len(au), key, now)
+        active = now < self.active_until
+
+        if self.recording:
+            # Finish the group of pictures before going idle
+            if active or not key:
+                self._write(au, key, now)
+                return
+            self.recording = False
+            Log.print(f'Recorder: activity stopped [{self.hash}]')
+
+        # Idle: recent groups of pictures wait in the pre-roll
+        if key:
+            self.gops.append([])
+        if not self.gops:
+            return
+        self.gops[-1].append((now, au, key))
+
+        if active:
+            self.recording = True
+            Log.print(f'Recorder: activity started [{self.hash}]')
+            for gop in self.gops:
+                for frame_time, frame, frame_key in gop:
+                    self._write(frame, frame_key, frame_time)
+            self.gops.clear()
+            return
+
+        # Groups leaving the pre-roll are dropped, except a keyframe every "storage_idle_keyframe_secs"
+        while len(self.gops) > 1 and self.gops[1][0][0] <= now - self.preroll:
+            frame_time, frame, _key = self.gops.popleft()[0]
+            if frame_time - self.last_key_time >= self.idle_keyframe:
+                self._write(frame, True, frame_time)
+
+    def _measure(self, size, key, now):
+        """ Motion makes inter frames bigger: compare the recent average with the usual one
+        """
+        if key:
+            return
+        if self.usual is None:
+            self.recent, self.usual = size, size
+        self.recent += (size - self.recent) * 0.2  # A few frames
+        self.usual += (size - self.usual) * 0.002  # Tens of seconds
+        if self.recent > self.usual * self.ratio:
+            self.active_until = now + self.hold
+
+    def _write(self, au, key, frame_time):
+        if key:
+            self.last_key_time = frame_time
+        self.output(au, key)
+
+
+class RecorderUdpProtocol(asyncio.DatagramProtocol):
+    def __init__(self, recorder):
+        self.recorder = recorder
+
+    def datagram_received(self, data, addr):
+        self.recorder.packet(data)
+
+
+class Depacketizer:
+    """ RTP payloads (RFC 6184, RFC 7798) to Annex B access units.
+        Keyframes always start with the latest parameter sets, so every one of them can be decoded alone.
+    """
+    start_code = b'\x00\x00\x00\x01'
+
+    def __init__(self, codec):
+        self.h265 = codec == 'h265'
+        self.nals = []
+        self.fragment = None
+        self.key, self.has_params = False, False
+        self.params = {}  # Latest parameter sets by NAL type
+
+    def push(self, payload):
+        if len(payload) < 3:
+            return
+        if self.h265:
+            nal_type = (payload[0] >> 1) & 0x3F
+            if nal_type == 48:  # Aggregation packet
+                self._aggregated(payload, 2)
+            elif nal_type == 49:  # Fragmentation unit
+                self._fragment(payload[2], bytes([(payload[0] & 0x81) | ((payload[2] & 0x3F) << 1), payload[1]]),
+                               payload[3:])
+            else:
+                self._nal(payload)
+        else:
+            nal_type = payload[0] & 0x1F
+            if nal_type == 24:  # STAP-A
+                self._aggregated(payload, 1)
+            elif nal_type == 28:  # FU-A
+                self._fragment(payload[1], bytes([(payload[0] & 0xE0) | (payload[1] & 0x1F)]), payload[2:])
+            else:
+                self._nal(payload)
+
+    def pop(self):
+        """ Returns collected access unit and keyframe flag
+        """
+        nals, key = self.nals, self.key
+        if key and not self.has_params:
+            nals = list(self.params.values()) + nals
+        self.nals, self.fragment = [], None
+        self.key, self.has_params = False, False
+        return b''.join(nals), key
+
+    def _aggregated(self, payload, offset):
+        while offset + 2 < len(payload):
+            size = int.from_bytes(payload[offset:offset + 2], 'big')
+            self._nal(payload[offset + 2:offset + 2 + size])
+            offset += 2 + size
+
+    def _fragment(self, header, nal_header, data):
+        if header & 0x80:  # Start
+            self.fragment = bytearray(nal_header)
+        if self.fragment is None:
+            return  # The start is lost
+        self.fragment += data
+        if header & 0x40:  # End
+            self._nal(bytes(self.fragment))
+            self.fragment = None
+
+    def _nal(self, nal):
+        if not nal:
+            return
+        nal = self.start_code + bytes(nal)
+        if self.h265:
+            nal_type = (nal[4] >> 1) & 0x3F
+            is_key, is_param = 16 <= nal_type <= 21, 32 <= nal_type <= 34
+        else:
+            nal_type = nal[4] & 0x1F
+            is_key, is_param = nal_type == 5, nal_type in (7, 8)
+        if is_param:
+            self.params[nal_type] = nal
+            self.has_params = True
+        self.key = self.key or is_key
+        self.nals.append(nal)
+
+
+def _get_setting(name, default):
+    return getattr(Config, name) if hasattr(Config, name) else default
@@ -1,2 +1,53 @@
+from _config import Config
+
+
 class Shared:
-    data = {}
+    # All tasks will communicate through this registry: {camera_hash: {profile: Stream}}
+    streams = {}
+
+
+class Stream:
+    """ One profile of the camera: its connection, clients and tracks
+    """
+    __slots__ = ('camera_hash', 'profile', 'camera', 'clients', 'pending', 'tracks')
+
+    def __init__(self, camera_hash, profile):
+        self.camera_hash = camera_hash
+        self.profile = profile
+        self.camera = None
+        self.clients = set()  # Subscribed clients
+        self.pending = set()  # Clients in the handshake, they keep the camera open till PLAY or close
+        self.tracks = (Track(0), Track(1))  # Video and audio
+
+    def subscribe(self, client):
+        self.pending.discard(client)
+        self.clients.add(client)
+        self._update_tracks()
+
+    def unsubscribe(self, client):
+        self.clients.discard(client)
+        self._update_tracks()
+
+    def _update_tracks(self):
+        """ Replace subscribers of every track, so the data path never looks them up
+        """
+        clients = tuple(self.clients)
+
+        if Config.tcp_mode:
+            # All channels are interleaved into the client's RTSP connection
+            self.tracks[0].subscribers = clients
+            return
+
+        for track in self.tracks:
+            track.subscribers = tuple(
+                (client.host, client.udp_ports[track.idx][0]) for client in clients if track.idx in client.udp_ports)
+
+
+class Track:
+    """ Forwarding list of the track: clients in TCP mode, (host, port) addresses in UDP mode
+    """
+    __slots__ = ('idx', 'subscribers')
+
+    def __init__(self, idx):
+        self.idx = idx
+        self.subscribers = ()
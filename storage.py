@@ -1,21 +1,33 @@
 import asyncio
+import os
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from _config import Config
 from log import Log
+from recorder import Recorder
 
 
 class Storage:
     def __init__(self, camera_hash):
         self._hash = camera_hash
         self._main_process = None
+        self._recorder = None
+        self._recording = None  # The recorder's task, the watchdog restarts it
+        self._file = None     # Used by the writer thread only
+        self._file_end = 0
+        # Recorded frames are written in order by one thread
+        self._writer = ThreadPoolExecutor(1, thread_name_prefix=f'storage-{camera_hash}')
 
     async def run(self):
         """ Start fragments saving
         """
         while True:
             try:
-                await self._save_fragment()
+                if self._activity_mode():
+                    await self._record_activity()
+                else:
+                    await self._save_fragment()
             except Exception as e:
                 Log.print(f'Storage: ERROR: can\'t save fragment "{self._hash}", trying again ({repr(e)})')
                 await asyncio.sleep(5)
@@ -53,6 +65,57 @@ class Storage:
         finally:
             await self._kill('fragment')
 
+    def _activity_mode(self):
+        cfg = Config.cameras[self._hash]
+        if 'storage_activity' in cfg:
+            return cfg['storage_activity']
+        return Config.storage_activity if hasattr(Config, 'storage_activity') else False
+
+    async def _record_activity(self):
+        """ Activity-gated recording of the proxied stream instead of the "storage_command"
+        """
+        self._recorder = Recorder(self._hash, self._write_frame)
+        self._recording = asyncio.create_task(self._recorder.run())
+        try:
+            await asyncio.wait([self._recording])
+            if self._recording.cancelled():
+                raise RuntimeError('the recorder is stalled')
+            self._recording.result()
+        finally:
+            self._recording.cancel()
+            self._recording = None
+            self._writer.submit(self._write, None, None)
+            self._file_end = 0
+
+    def _write_frame(self, data, key):
+        """ Recorder's output: elementary stream fragments, every one starts with a keyframe.
+            The disk is slow, files are written by the writer thread
+        """
+        filename = None
+        if key and time.time() >= self._file_end:
+            cfg = Config.cameras[self._hash]
+            path = f'{Config.storage_path}/{cfg["path"]}/{time.strftime("%Y-%m-%d")}'
+            filename = f'{path}/{time.strftime("%H:%M")}.{self._recorder.codec}'
+            self._file_end = time.time() + Config.storage_fragment_secs
+            asyncio.create_task(self._clean('fragment'))
+        if self._file_end:
+            self._writer.submit(self._write, data, filename)
+
+    def _write(self, data, filename):
+        """ Writer thread: start new fragment file if the filename is given, no data closes the file
+        """
+        try:
+            if self._file and (filename or data is None):
+                self._file.close()
+                self._file = None
+            if filename:
+                os.makedirs(os.path.dirname(filename), exist_ok=True)
+                self._file = open(filename, 'ab')
+            if self._file and data:
+                self._file.write(data)
+        except OSError as e:
+            Log.print(f'Storage: ERROR: can\'t write "{self._hash}" ({repr(e)})')
+
     async def _execute(self, cmd):
         """ Run given cmd in background
         """
@@ -88,7 +151,11 @@ class Storage:
             Log.print(f'Storage: {msg}: ERROR: can\'t kill process {self._main_process.pid} for "{self._hash}"'
                       f' ({repr(e)})')
 
-        # Delete all subdirectories older than "storage_period_days"
+        await self._clean(msg)
+
+    async def _clean(self, msg):
+        """ Delete all subdirectories older than "storage_period_days"
+        """
         try:
             cfg = Config.cameras[self._hash]
             await _delete_old_dir(f'{Config.storage_path}/{cfg["path"]}')
@@ -110,6 +177,14 @@ class Storage:
         """ Extremely important piece.
             Cameras can turn off on power loss, or external commands can freeze.
         """
+        if self._activity_mode():
+            # Idle cameras write a keyframe rarely, the files can't tell if the recorder receives the stream
+            if not self._recording or time.monotonic() - self._recorder.frame_time < Config.watchdog_interval:
+                return
+            self._recording.cancel()
+            Log.print(f'Storage: watchdog: restart "{self._hash}"')
+            return
+
         cfg = Config.cameras[self._hash]
         dirname = time.strftime('%Y-%m-%d')
         path = f'{Config.storage_path}/{cfg["path"]}/{dirname}'
@@ -0,0 +1,146 @@
+import time
+from _config import Config
+from log import Log
+
+
+class Tracer:
+    """ Latency histograms of the packets path, by stream and stage:
+            arrival - interval between packets from the camera,
+            enqueue - from packet receiving to handing it over to the client's socket,
+            flush   - from handing over to leaving the client's queue and socket buffer,
+            fanout  - from packet receiving to the last client.
+        Disabled tracing costs nothing: the data path checks one attribute.
+    """
+    enabled = Config.trace_enable if hasattr(Config, 'trace_enable') else False
+    _traces = {}  # {(camera_hash, profile): Trace}
+
+    @staticmethod
+    def get(camera_hash, profile):
+        """ Returns stream's trace or None if tracing is disabled
+        """
+        if not Tracer.enabled:
+            return
+        key = (camera_hash, profile)
+        if key not in Tracer._traces:
+            Tracer._traces[key] = Trace()
+        return Tracer._traces[key]
+
+    @staticmethod
+    def report():
+        """ Write percentiles of all histograms to the log
+        """
+        if not Tracer.enabled:
+            Log.write('Tracer: disabled, set "trace_enable" in the configuration file')
+            return
+        for (camera_hash, profile), trace in Tracer._traces.items():
+            for stage in Trace.stages:
+                Log.write(f'Tracer: [{camera_hash}] [{profile}] {stage}: {getattr(trace, stage)}')
+
+
+class Trace:
+    """ Timings of one stream
+    """
+    __slots__ = ('arrival', 'enqueue', 'flush', 'fanout', '_last', '_written', '_pending')
+    stages = ('arrival', 'enqueue', 'flush', 'fanout')
+
+    def __init__(self):
+        self.arrival, self.enqueue, self.flush, self.fanout = Histogram(), Histogram(), Histogram(), Histogram()
+        self._last = None
+        self._written = {}  # Bytes handed over to every client's socket (TCP mode)
+        self._pending = {}  # First not flushed packet of every client: (enqueue time, bytes mark)
+
+    def sendto(self, data, subscribers, sendto, received=None):
+        """ Timed UDP fan-out: datagrams leave at once, so the flush is the time of the send call.
+            A packet held by the jitter buffer comes with its receive time
+        """
+        if not received:
+            received = self.receive()
+        for addr in subscribers:
+            enqueued = time.perf_counter_ns()
+            self.enqueue.record((enqueued - received) // 1000)
+            sendto(data, addr)
+            self.flush.record((time.perf_counter_ns() - enqueued) // 1000)
+        self.fanout.record((time.perf_counter_ns() - received) // 1000)
+
+    def write(self, frame, subscribers, slab=None):
+        """ Timed TCP fan-out: follow the first pending packet of every client until it leaves the socket buffer
+        """
+        received = self.receive()
+        for client in subscribers:
+            enqueued = time.perf_counter_ns()
+            self.enqueue.record((enqueued - received) // 1000)
+            client.write(frame, slab)
+
+            written = self._written.get(client, 0) + len(frame)
+            self._written[client] = written
+            if not self._pending.get(client):
+                self._pending[client] = (enqueued, written)
+            self.flushed(client)
+        self.fanout.record((time.perf_counter_ns() - received) // 1000)
+
+    def flushed(self, client):
+        """ Check if the pending packet of the client is sent (called on every client's write and flush)
+        """
+        pending = self._pending.get(client)
+        if not pending:
+            return
+        drained = self._written[client] - client.writer.transport.get_write_buffer_size() - client.queued
+        if pending[1] <= drained:
+            self.flush.record((time.perf_counter_ns() - pending[0]) // 1000)
+            self._pending[client] = None
+
+    def forget(self, client):
+        self._written.pop(client, None)
+        self._pending.pop(client, None)
+
+    def receive(self):
+        """ Record the packet's arrival, returns its receive time
+        """
+        now = time.perf_counter_ns()
+        if self._last:
+            self.arrival.record((now - self._last) // 1000)
+        self._last = now
+        return now
+
+
+class Histogram:
+    """ HDR-like histogram of microseconds: 16 linear sub-buckets for every power of two, about 6% precision.
+        Constant memory and O(1) recording.
+    """
+    __slots__ = ('counts', 'count', 'max')
+    _size = 16 * 40
+
+    def __init__(self):
+        self.counts = [0] * Histogram._size
+        self.count, self.max = 0, 0
+
+    def record(self, value):
+        if value < 16:
+            idx = value
+        else:
+            shift = value.bit_length() - 5
+            idx = min(shift * 16 + (value >> shift), Histogram._size - 1)
+        self.counts[idx] += 1
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, p):
+        """ Lower bound of the bucket of given percentile
+        """
+        rank = self.count * p / 100
+        seen = 0
+        for idx, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                if idx < 16:
+                    return idx
+                shift = idx // 16 - 1
+                return (idx - shift * 16) << shift
+        return 0
+
+    def __str__(self):
+        if not self.count:
+            return 'no data'
+        return f'p50 {self.percentile(50)} us, p90 {self.percentile(90)} us, p99 {self.percentile(99)} us, ' \
+            f'max {self.max} us, count {self.count}'